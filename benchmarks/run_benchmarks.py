@@ -0,0 +1,359 @@
+# File: sem7/benchmarks/run_benchmarks.py
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+import io
+import numpy as np
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+from simulation.guass_morkov import run_simulation, stream_simulation, find_nearest_sensor
+from simulation.sensor_index import build_sensor_index
+from simulation.online_simulator import run_single_online_iteration
+from simulation.recipes import resolve_catalog
+from simulation.trace import as_request_trace
+from simulation.rng import make_rng
+from mdp.solver import (solve_mdp, solve_mdp_batch, solve_mdp_threshold_batch, get_or_generate_brain,
+                        ALPHA_RANGE, BETA_RANGE, MDP_SOLVER_PARAMS)
+
+# ==============================================================================
+# BENCHMARK SUITE FOR THE SIMULATION AND MDP HOT PATHS
+# ==============================================================================
+"""
+Times the hot paths of the pipeline on scaled scenarios with fixed seeds and
+writes one machine-readable JSON file per run (tagged with the git commit), so
+runs on different commits can be compared stage by stage.
+
+    python benchmarks/run_benchmarks.py --scale small
+    python benchmarks/run_benchmarks.py --scale medium --stages simulation online --no-memory
+
+Every stage reports its best wall time over --repeat runs, a throughput
+(requests/s, queries/s, decisions/s or Bellman backups/s) and, unless
+--no-memory, the tracemalloc peak of one extra run. Scenarios marked "streamed"
+generate requests chunk by chunk (stream_simulation) so memory stays bounded;
+their online stages then include the request generation time. The per-lookup
+reference implementations (scalar online loop, loop MDP solver, linear nearest
+sensor scan) are only run where they finish in reasonable time.
+
+--dq-zipf S draws the DQs of every request with Zipf(S) popularity instead of
+uniformly; the online rows then show the cache behaviour under that skew
+(sensor_accesses next to the decision count).
+"""
+AREA = (0, 10000, 0, 10000)
+MEAN_SPEED = 15
+MOBILITY_ALPHA = 0.75
+BASE_SEED = 20240601
+# Random stream of each stage: make_rng(BASE_SEED, STREAM_KEYS[stage])
+STREAM_KEYS = {"simulation": 0, "online": 1, "nearest_sensor": 2, "mdp": 3}
+
+# users / sensors / duration drive the simulation stages, max_aoi the MDP stages
+SCENARIOS = {
+    "small":  {"users": 50, "sensors": 450, "duration": 100, "max_aoi": 100,
+               "streamed": False, "scalar": True},
+    "medium": {"users": 1000, "sensors": 5000, "duration": 1000, "max_aoi": 1000,
+               "streamed": False, "scalar": True},
+    "large":  {"users": 10000, "sensors": 20000, "duration": 8640, "max_aoi": 5000,
+               "streamed": True, "scalar": False},
+    "xlarge": {"users": 100000, "sensors": 50000, "duration": 86400, "max_aoi": 10000,
+               "streamed": True, "scalar": False},
+}
+STAGES = ("simulation", "nearest_sensor", "online", "mdp", "brain")
+
+STREAM_CHUNK_STEPS = 100
+NEAREST_SCAN_QUERIES = 2000     # queries for the linear find_nearest_sensor scan
+NEAREST_BATCH_QUERIES = 1000000 # queries for the KD-tree batch lookup
+MDP_PAIRS = 9                   # (alpha, beta) pairs per batch, about one per category
+LOOP_SOLVER_MAX_AOI = 1000      # the per-state loop solver is skipped above this
+
+# --- Measurement helpers ---
+def measure(fn, repeat=3, memory=True):
+    """Returns (best seconds over `repeat` runs, tracemalloc peak bytes or None, last return value)."""
+    best = float("inf")
+    out = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return best, peak, out
+
+def record(results, stage, name, seconds, peak, work=None, unit=None, **extra):
+    """Appends one result row; throughput = work / seconds."""
+    row = {
+        "stage": stage,
+        "name": name,
+        "seconds": seconds,
+        "peak_memory_bytes": peak,
+    }
+    if work is not None:
+        row["work"] = int(work)
+        row["unit"] = unit
+        row["throughput"] = work / seconds if seconds > 0 else None
+    row.update(extra)
+    results.append(row)
+    throughput = f"{row['throughput']:.4g} {unit}/s" if work is not None else ""
+    memory = f"{peak / 2**20:.1f} MiB" if peak is not None else "-"
+    print(f"  {stage:<15} {name:<36} {seconds:>10.4f} s  {throughput:<28} peak {memory}")
+
+def git_commit():
+    """(commit hash, dirty?) of the checkout the benchmarks run from, or (None, None) outside git."""
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def scenario_catalog(scenario):
+    """Recipe catalog of a scenario: the built-in one, with Zipf DQ popularity if dq_zipf is set."""
+    return resolve_catalog(None, scenario.get("dq_zipf"))
+
+def simulate(scenario, stage, trace_format="columnar"):
+    """simulation_events of a scenario (a streamed generator of chunks if the scenario is streamed)."""
+    args = dict(num_users=scenario["users"], num_sensors=scenario["sensors"], area=AREA,
+                duration=scenario["duration"], mean_speed=MEAN_SPEED, alpha=MOBILITY_ALPHA,
+                trace_format=trace_format, rng=make_rng(BASE_SEED, STREAM_KEYS[stage]),
+                catalog=scenario_catalog(scenario))
+    if scenario["streamed"]:
+        return stream_simulation(chunk_steps=STREAM_CHUNK_STEPS, **args)
+    return run_simulation(**args)
+
+def iter_traces(simulation_events):
+    if "request_chunks" in simulation_events:
+        for chunk in simulation_events["request_chunks"]:
+            yield as_request_trace(chunk)
+    else:
+        yield as_request_trace(simulation_events["requests"])
+
+def count_lookups(trace, dq_table):
+    """Number of per-parameter decisions the online phase makes for a trace."""
+    if len(trace.dq_values) == 0:
+        return 0
+    dq_values = np.asarray(trace.dq_values, dtype=np.int64)
+    dq_table.ensure(int(dq_values.max()))
+    return int(dq_table.counts[dq_values].sum())
+
+class _CountingEvents(dict):
+    """simulation_events whose request chunks are counted (requests, lookups) as they are consumed."""
+
+    def __init__(self, simulation_events, dq_table):
+        super().__init__(simulation_events)
+        self.requests = 0
+        self.lookups = 0
+        self["request_chunks"] = self._count(simulation_events["request_chunks"], dq_table)
+
+    def _count(self, chunks, dq_table):
+        for chunk in chunks:
+            trace = as_request_trace(chunk)
+            self.requests += len(trace)
+            self.lookups += count_lookups(trace, dq_table)
+            yield trace
+
+# --- Stages ---
+def bench_simulation(scenario, results, repeat, memory):
+    def run():
+        events = simulate(scenario, "simulation")
+        return sum(len(trace) for trace in iter_traces(events))
+
+    seconds, peak, num_requests = measure(run, repeat, memory)
+    record(results, "simulation", "stream_simulation" if scenario["streamed"] else "run_simulation",
+           seconds, peak, num_requests, "requests")
+
+def bench_nearest_sensor(scenario, results, repeat, memory):
+    rng = make_rng(BASE_SEED, STREAM_KEYS["nearest_sensor"])
+    static_sensors = {
+        'x': rng.uniform(AREA[0], AREA[1], scenario["sensors"]).tolist(),
+        'y': rng.uniform(AREA[2], AREA[3], scenario["sensors"]).tolist(),
+    }
+    xs = rng.uniform(AREA[0], AREA[1], NEAREST_BATCH_QUERIES)
+    ys = rng.uniform(AREA[2], AREA[3], NEAREST_BATCH_QUERIES)
+
+    def scan():
+        for x, y in zip(xs[:NEAREST_SCAN_QUERIES].tolist(), ys[:NEAREST_SCAN_QUERIES].tolist()):
+            find_nearest_sensor((x, y), static_sensors)
+
+    seconds, peak, _ = measure(scan, repeat, memory)
+    record(results, "nearest_sensor", "find_nearest_sensor (scan)", seconds, peak, NEAREST_SCAN_QUERIES, "queries")
+
+    seconds, peak, _ = measure(lambda: build_sensor_index(static_sensors), repeat, memory)
+    record(results, "nearest_sensor", "build_sensor_index", seconds, peak, scenario["sensors"], "sensors")
+
+    sensor_index = build_sensor_index(static_sensors)
+    seconds, peak, _ = measure(lambda: sensor_index.nearest_batch(xs, ys), repeat, memory)
+    record(results, "nearest_sensor", "SensorIndex.nearest_batch", seconds, peak, NEAREST_BATCH_QUERIES, "queries")
+
+def bench_online(scenario, results, repeat, memory, brain):
+    master_policies, param_classifications = brain
+    engines = ["batched"] + (["scalar"] if scenario["scalar"] else [])
+    dq_table = catalog = scenario_catalog(scenario)
+
+    if scenario["streamed"]:
+        # Chunks are generated while they are replayed, so the timings include request generation
+        for engine in engines:
+            counters = []
+
+            def run():
+                events = _CountingEvents(simulate(scenario, "online"), dq_table)
+                counters.append(events)
+                return run_single_online_iteration(scenario["users"], master_policies, param_classifications,
+                                                   simulation_events=events, engine=engine, catalog=catalog)
+
+            seconds, peak, result = measure(run, repeat, memory)
+            events = counters[-1]
+            record(results, "online", f"online ({engine}, streamed)", seconds, peak, events.lookups, "decisions",
+                   requests=events.requests, sensor_accesses=result["total_sensor_accesses"],
+                   includes_generation=True)
+        return
+
+    events = simulate(scenario, "online")
+    sensor_index = build_sensor_index(events["static_sensors"])
+    events["sensor_index"] = sensor_index
+    trace = as_request_trace(events["requests"])
+    num_lookups = count_lookups(trace, dq_table)
+    for engine in engines:
+        seconds, peak, result = measure(
+            lambda: run_single_online_iteration(scenario["users"], master_policies, param_classifications,
+                                                simulation_events=events, engine=engine, catalog=catalog),
+            repeat, memory
+        )
+        record(results, "online", f"online ({engine})", seconds, peak, num_lookups, "decisions",
+               requests=len(trace), requests_per_second=len(trace) / seconds if seconds > 0 else None,
+               sensor_accesses=result["total_sensor_accesses"])
+
+def bench_mdp(scenario, results, repeat, memory):
+    max_aoi = scenario["max_aoi"]
+    solver_args = dict(resource_cost=MDP_SOLVER_PARAMS["resource_cost"], max_aoi=max_aoi,
+                       gamma=MDP_SOLVER_PARAMS["gamma"])
+    epsilon = MDP_SOLVER_PARAMS["epsilon"]
+    rng = make_rng(BASE_SEED, STREAM_KEYS["mdp"])
+    alphas = rng.uniform(*ALPHA_RANGE, MDP_PAIRS)
+    betas = rng.uniform(*BETA_RANGE, MDP_PAIRS)
+
+    # A Bellman backup evaluates both actions of one state; sweeps come from the batch solver,
+    # which runs the same Gauss-Seidel iteration as solve_mdp
+    _, sweeps = solve_mdp_batch(alphas, betas, epsilon=epsilon, return_sweeps=True, **solver_args)
+    backups = sweeps * max_aoi
+
+    if max_aoi <= LOOP_SOLVER_MAX_AOI:
+        seconds, peak, _ = measure(
+            lambda: solve_mdp(alphas[0], betas[0], epsilon=epsilon, method="loop", **solver_args), repeat, memory
+        )
+        record(results, "mdp", "solve_mdp (loop, 1 pair)", seconds, peak, backups[0], "backups")
+
+    seconds, peak, _ = measure(
+        lambda: solve_mdp_batch(alphas, betas, epsilon=epsilon, **solver_args), repeat, memory
+    )
+    record(results, "mdp", f"solve_mdp_batch ({MDP_PAIRS} pairs)", seconds, peak, backups.sum(), "backups",
+           sweeps=sweeps.tolist())
+
+    seconds, peak, _ = measure(lambda: solve_mdp_threshold_batch(alphas, betas, **solver_args), repeat, memory)
+    record(results, "mdp", f"solve_mdp_threshold_batch ({MDP_PAIRS} pairs)", seconds, peak,
+           MDP_PAIRS * (max_aoi + 1), "thresholds")
+
+def bench_brain(results, repeat, memory):
+    """Cold (empty brain_dir) and warm (cached artifact) get_or_generate_brain; output is silenced."""
+    def cold():
+        with tempfile.TemporaryDirectory() as brain_dir, contextlib.redirect_stdout(io.StringIO()):
+            return get_or_generate_brain(brain_dir=brain_dir, seed=BASE_SEED)
+
+    seconds, peak, _ = measure(cold, repeat, memory)
+    record(results, "brain", "get_or_generate_brain (cold)", seconds, peak)
+
+    with tempfile.TemporaryDirectory() as brain_dir:
+        with contextlib.redirect_stdout(io.StringIO()):
+            get_or_generate_brain(brain_dir=brain_dir, seed=BASE_SEED)
+
+        def warm():
+            with contextlib.redirect_stdout(io.StringIO()):
+                return get_or_generate_brain(brain_dir=brain_dir, seed=BASE_SEED)
+
+        seconds, peak, brain = measure(warm, repeat, memory)
+        record(results, "brain", "get_or_generate_brain (warm)", seconds, peak)
+    return brain
+
+def run_benchmarks(scenario, stages, repeat=3, memory=True):
+    """Runs the selected stages on one scenario and returns the list of result rows."""
+    results = []
+    brain = None
+    if "brain" in stages:
+        brain = bench_brain(results, repeat, memory)
+    if "simulation" in stages:
+        bench_simulation(scenario, results, repeat, memory)
+    if "nearest_sensor" in stages:
+        bench_nearest_sensor(scenario, results, repeat, memory)
+    if "online" in stages:
+        if brain is None:
+            with tempfile.TemporaryDirectory() as brain_dir, contextlib.redirect_stdout(io.StringIO()):
+                brain = get_or_generate_brain(brain_dir=brain_dir, seed=BASE_SEED)
+        bench_online(scenario, results, repeat, memory, brain)
+    if "mdp" in stages:
+        bench_mdp(scenario, results, repeat, memory)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulation and MDP hot paths.")
+    parser.add_argument("--scale", choices=list(SCENARIOS), default="small")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark (best is kept).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc peak-memory runs.")
+    parser.add_argument("--users", type=int, help="Override the scenario's user count.")
+    parser.add_argument("--sensors", type=int, help="Override the scenario's sensor count.")
+    parser.add_argument("--duration", type=int, help="Override the scenario's duration.")
+    parser.add_argument("--max-aoi", type=int, help="Override the scenario's max_aoi.")
+    parser.add_argument("--dq-zipf", type=float, help="Zipf exponent of the DQ popularity (default: uniform).")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<scale>_<commit>.json).")
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIOS[args.scale])
+    for key in ("users", "sensors", "duration", "max_aoi", "dq_zipf"):
+        if getattr(args, key) is not None:
+            scenario[key] = getattr(args, key)
+
+    commit, dirty = git_commit()
+    print(f"Scenario {args.scale}: {scenario} (commit {commit[:12] if commit else 'unknown'}"
+          f"{', dirty' if dirty else ''})")
+    results = run_benchmarks(scenario, args.stages, repeat=args.repeat, memory=not args.no_memory)
+
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "scale": args.scale,
+        "scenario": scenario,
+        "base_seed": BASE_SEED,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results", f"{args.scale}_{(commit or 'nogit')[:12]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
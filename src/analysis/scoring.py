@@ -1,6 +1,11 @@
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestClassifier
+import os
+import json
+import hashlib
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
+from sklearn.model_selection import train_test_split
 
 def calculate_volatility_score(time_series_data):
     """
@@ -14,20 +19,141 @@ def calculate_volatility_score(time_series_data):
     percent_change = np.abs((data[1:] - data[:-1]) / (data[:-1] + 1e-9))
     return np.mean(percent_change)
 
-def get_criticality_scores(parameters, accident_data):
+class VolatilityAccumulator:
+    """
+    Streaming version of calculate_volatility_score. Feed the series chunk by chunk with update();
+    the last value of each chunk is carried over so the change across a chunk boundary is counted
+    exactly once. score() equals calculate_volatility_score on the concatenated series (up to
+    floating-point summation order).
+
+    Chunks may also be 2-D (rows x parameters), in which case one score per column is kept, so a
+    wide table of many parameters is scored in a single pass.
+    """
+
+    def __init__(self):
+        self.previous = None  # last value (or row) seen
+        self.total = 0.0
+        self.count = 0
+
+    def update(self, chunk):
+        data = np.asarray(chunk, dtype=float)
+        if len(data) == 0:
+            return
+        if self.previous is not None:
+            data = np.concatenate([self.previous[None, ...], data])
+        if len(data) >= 2:
+            percent_change = np.abs((data[1:] - data[:-1]) / (data[:-1] + 1e-9))
+            self.total = self.total + percent_change.sum(axis=0)
+            self.count += len(percent_change)
+        self.previous = data[-1].copy()
+
+    def score(self):
+        if self.count == 0:
+            return 0.0 if self.previous is None or self.previous.ndim == 0 else np.zeros(len(self.previous))
+        return self.total / self.count
+
+def iter_array_chunks(data, chunk_size):
+    """Yields consecutive slices of an array (e.g. a np.memmap) without loading it all at once."""
+    for start in range(0, len(data), chunk_size):
+        yield data[start:start + chunk_size]
+
+def calculate_volatility_score_streaming(chunks):
+    """Volatility score of a series given as an iterable of chunks (arrays, lists, memmap slices)."""
+    accumulator = VolatilityAccumulator()
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator.score()
+
+def calculate_volatility_scores_wide(chunks, columns=None):
+    """
+    Scores every parameter of a wide table (one column per parameter) in one pass.
+
+    Args:
+        chunks: iterable of DataFrames (e.g. pd.read_csv(..., chunksize=N)) or 2-D arrays.
+        columns (list): columns to score; required for arrays, defaults to all DataFrame columns.
+
+    Returns:
+        dict: {column: volatility score}
+    """
+    accumulator = VolatilityAccumulator()
+    for chunk in chunks:
+        if isinstance(chunk, pd.DataFrame):
+            if columns is None:
+                columns = list(chunk.columns)
+            chunk = chunk[columns].to_numpy(dtype=float)
+        accumulator.update(chunk)
+    scores = accumulator.score()
+    return {column: float(score) for column, score in zip(columns or [], np.atleast_1d(scores))}
+
+def _criticality_cache_key(parameters, accident_data, config):
+    """SHA-256 over the accident data actually used (features + target) and the model settings."""
+    digest = hashlib.sha256()
+    used = accident_data[list(parameters) + ['Accident_Severity']]
+    digest.update(pd.util.hash_pandas_object(used, index=False).to_numpy().tobytes())
+    digest.update(json.dumps({"parameters": list(parameters), **config}, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def _stratified_subsample(X, y, max_samples, random_state):
+    """Keeps at most max_samples rows, preserving the class proportions of y."""
+    if max_samples is None or len(X) <= max_samples:
+        return X, y
+    X_sub, _, y_sub, _ = train_test_split(
+        X, y, train_size=max_samples, stratify=y, random_state=random_state
+    )
+    return X_sub, y_sub
+
+def get_criticality_scores(parameters, accident_data, n_jobs=None, max_samples=None,
+                           estimator="random_forest", cache_dir=None, random_state=42):
     """
     Trains a model to predict accident severity and returns feature importances (equivalent
     to the step: AnalyzeAccidentData(D_Accident, P)).
+
+    Args:
+        n_jobs (int): Cores used to build the trees (-1 = all cores). Does not change the result.
+        max_samples (int): If the data has more rows, fit on a stratified subsample of this size.
+        estimator (str): "random_forest" (default) or "hist_gradient_boosting", a histogram-based
+            model for very large datasets whose importances come from permutation importance.
+        cache_dir (str): If given, importances are cached there, keyed by a hash of the data,
+            the parameter list and these settings, and reused instead of retraining.
     """
+    config = {"estimator": estimator, "max_samples": max_samples, "random_state": random_state, "n_estimators": 100}
+    cache_path = None
+    if cache_dir is not None:
+        key = _criticality_cache_key(parameters, accident_data, config)
+        cache_path = os.path.join(cache_dir, f"criticality_{key[:16]}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, 'r') as f:
+                cached = json.load(f)
+            print("Criticality scores loaded from cache.")
+            return {param: cached[param] for param in parameters}
+
     print("Training ML model to determine criticality scores...")
     # Use all unique parameters (P) for training features (X)
     X = accident_data[parameters]
     y = accident_data['Accident_Severity']
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    model.fit(X, y)
-    importances = model.feature_importances_
-    criticality_scores = {param: score for param, score in zip(parameters, importances)}
+    X, y = _stratified_subsample(X, y, max_samples, random_state)
+
+    if estimator == "random_forest":
+        model = RandomForestClassifier(n_estimators=100, random_state=random_state, n_jobs=n_jobs)
+        model.fit(X, y)
+        importances = model.feature_importances_
+    elif estimator == "hist_gradient_boosting":
+        model = HistGradientBoostingClassifier(random_state=random_state)
+        model.fit(X, y)
+        permuted = permutation_importance(model, X, y, n_repeats=5, random_state=random_state, n_jobs=n_jobs)
+        # Normalize like tree importances: non-negative and summing to 1
+        importances = np.clip(permuted.importances_mean, 0, None)
+        importances = importances / importances.sum() if importances.sum() > 0 else np.full(len(parameters), 1 / len(parameters))
+    else:
+        raise ValueError(f"Unknown criticality estimator: {estimator!r}")
+
+    criticality_scores = {param: float(score) for param, score in zip(parameters, importances)}
     print("ML model trained. Criticality scores extracted.")
+
+    if cache_path is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(criticality_scores, f, indent=2)
     return criticality_scores
 
 def categorize_scores(scores_dict):
@@ -51,14 +177,20 @@ def categorize_scores(scores_dict):
     return categories
 
 # --- New Master Function aligned with Algorithm 1 ---
-def perform_offline_parameter_characterization(all_parameters, time_series_data, accident_data):
+def perform_offline_parameter_characterization(all_parameters, time_series_data, accident_data, chunk_size=None,
+                                               criticality_options=None):
     """
     Orchestrates the entire offline parameter characterization process (Algorithm 1).
     
     Args:
         all_parameters (list): The set of all unique decision parameters (P).
-        time_series_data (dict): Historical time-series data (D_TS).
+        time_series_data (dict): Historical time-series data (D_TS). Values may be
+            in-memory arrays or memory-mapped arrays (np.load(..., mmap_mode="r")).
         accident_data (DataFrame): Historical accident data (D_Accident).
+        chunk_size (int): If given, volatility is computed over chunks of this many
+            samples so long series are never materialized as a whole.
+        criticality_options (dict): Keyword arguments for get_criticality_scores
+            (n_jobs, max_samples, estimator, cache_dir, ...).
         
     Returns:
         tuple: (C_map, S_vol, S_crit) where C_map is the final classification.
@@ -66,13 +198,19 @@ def perform_offline_parameter_characterization(all_parameters, time_series_data,
     # 1. Initialization is implicit, P is passed as all_parameters
     
     # 2. Calculate Volatility Scores (S_vol) -> S_vol
-    S_vol = {
-        p: calculate_volatility_score(time_series_data[p]) 
-        for p in all_parameters
-    }
+    if chunk_size is None:
+        S_vol = {
+            p: calculate_volatility_score(time_series_data[p]) 
+            for p in all_parameters
+        }
+    else:
+        S_vol = {
+            p: calculate_volatility_score_streaming(iter_array_chunks(time_series_data[p], chunk_size))
+            for p in all_parameters
+        }
     
     # 3. Calculate Criticality Scores (S_crit) -> S_crit
-    S_crit = get_criticality_scores(all_parameters, accident_data)
+    S_crit = get_criticality_scores(all_parameters, accident_data, **(criticality_options or {}))
     
     # 4. Categorize Volatility Scores -> C_volatility
     C_volatility = categorize_scores(S_vol)
@@ -1,25 +1,52 @@
-import numpy as np
 import json
-from collections import defaultdict
-import pandas as pd # Import pandas for easier handling of complex averages
 
 # --- Import all necessary functions from your project modules ---
 from mdp.solver import get_or_generate_brain
-from simulation.online_simulator import run_single_online_iteration
-from simulation.guass_morkov import run_simulation # Need this to pre-run for request counts
+from simulation.sweep import run_sweep, write_profile_record
+from simulation.scheduler import SweepGrid, run_scheduled_sweep
+from simulation.policies import default_policies
+from simulation.recipes import resolve_catalog
+from simulation.instrumentation import Profiler
 
-def main():
+def main(workers=1, chunksize=1, seed=None, cache_capacity=None, eviction="lru", coalesce=False,
+         compare_ttl=None, aoi_percentiles=False, results_dir=None, user_counts=None,
+         iterations=100, profile_path=None, aoi_model="lookup", dq_catalog=None, dq_zipf=None):
     """
     Main orchestration script. Runs the entire pipeline:
     1. Offline Phase: Generates or loads the MDP policies ("the brain").
     2. Online Phase: Runs the full simulation experiment using the brain.
     3. Results: Saves the final aggregated data for plotting.
+
+    workers > 1 (or None for all cores) spreads the iterations over a process pool,
+    handing out `chunksize` (num_users, iteration) tasks at a time. `seed` fixes the base
+    seed of the per-iteration random streams, making the whole sweep reproducible.
+    cache_capacity/eviction bound the online edge cache and coalesce enables per-step
+    fetch coalescing (see run_single_online_iteration). compare_ttl replays every trace against
+    A2C-Safe, Static TTL (with that TTL) and No Caching, saving one results block per scheme.
+    aoi_percentiles adds p50/p95/p99 of the decision-time AoI to every "vs_users" entry.
+    aoi_model="time" ages cached entries by elapsed time steps instead of by lookups.
+    dq_catalog (a recipe catalog JSON file, see simulation/recipes.py) replaces the built-in
+    DECISION_RECIPES and dq_zipf draws DQs with that Zipf exponent instead of uniformly.
+
+    With results_dir, finished (num_users, iterations) cells are checkpointed there, so an
+    interrupted run resumes where it stopped and adding user counts or iterations only runs
+    the new work. The default (None) runs the sweep from scratch without checkpoints.
+
+    profile_path appends profile records (instrumentation.py) as JSON lines: one for the
+    offline phase, then one per sweep iteration with its stage timers and counters.
     """
     # ==========================================================================
     # PHASE 1: OFFLINE BRAIN GENERATION (or loading from file)
     # ==========================================================================
     print("--- Running Offline Phase ---")
-    master_policies, param_classifications = get_or_generate_brain()
+    offline_profiler = Profiler() if profile_path else None
+    # The brain classifies the parameters of the active catalog's recipes
+    catalog = resolve_catalog(dq_catalog, dq_zipf)
+    master_policies, param_classifications = get_or_generate_brain(seed=seed, profiler=offline_profiler,
+                                                                   catalog=catalog)
+    if offline_profiler is not None:
+        with open(profile_path, "a") as f:
+            write_profile_record(f, "offline", offline_profiler.to_dict())
     print("--- Offline Phase Complete ---")
 
     # ==========================================================================
@@ -28,90 +55,47 @@ def main():
     print("\n--- Running Online Phase ---")
     
     # --- Define the Experiment Parameters ---
-    user_counts_to_simulate = [50, 75, 100, 125, 150, 175, 200] # UPDATED USER COUNTS
-    iterations_per_count = 100  
+    user_counts_to_simulate = user_counts or [50, 75, 100, 125, 150, 175, 200] # UPDATED USER COUNTS
+    iterations_per_count = iterations
     
-    # This dictionary will store all final results, ready for plotting
-    experiment_results = {
-        "vs_users": {},
-        "vs_time": {},
-        "vs_time_requests": {} # NEW: For requests vs time
-    }
+    # DQ catalog / popularity travel with the simulation parameters (and the checkpoint key)
+    sim_params = {key: value for key, value in (("dq_catalog", dq_catalog), ("dq_zipf", dq_zipf))
+                  if value is not None}
+    print(f"Sweeping {len(user_counts_to_simulate)} user counts x {iterations_per_count} iterations "
+          f"with {workers or 'all'} worker(s)...")
 
     # --- Run the Full Experiment ---
-    for num_users in user_counts_to_simulate:
-        print(f"\n--- Starting Experiment for {num_users} Users ({iterations_per_count} iterations) ---")
-        
-        # Lists to store the totals from each of the 100 iterations
-        run_totals = {
-            "sensor_accesses": [],
-            "energy_consumed": [],
-            "avg_aoi": [], 
-        }
-        # Dicts to aggregate time-series data across the 100 iterations
-        time_series_agg = {
-            "accesses": defaultdict(list), 
-            "energy": defaultdict(list),
-            "requests": defaultdict(list) # NEW: Aggregate request counts
-        }
-        
-        for i in range(iterations_per_count):
-            # We need to run the guass_morkov simulation to get requests BEFORE running the online simulator
-            # This is necessary because we need the raw request count for the "Requests vs Time" plot.
-            simulation_events = run_simulation(
-                num_users=num_users, num_sensors=450, area=(0, 10000, 0, 10000),
-                duration=100, mean_speed=15, alpha=0.75
-            )
-            
-            # Run one full simulation from the online_simulator module using the generated events
-            result = run_single_online_iteration(
-                num_users, master_policies, param_classifications, 
-                simulation_events=simulation_events # Pass events directly
-            )
-            
-            # --- Aggregate and store the request count data ---
-            request_counts_in_run = result["requests_over_time"] # Now available from online_simulator
-            for t, val in request_counts_in_run.items():
-                time_series_agg["requests"][t].append(val)
-            
-            # Store the total metrics for this iteration
-            run_totals["sensor_accesses"].append(result["total_sensor_accesses"])
-            run_totals["energy_consumed"].append(result["total_energy_consumed"])
-            run_totals["avg_aoi"].append(result["avg_aoi_for_qos"])
-            
-            # Append the time-series data for this run
-            for t, val in result["accesses_over_time"].items():
-                time_series_agg["accesses"][t].append(val)
-            for t, val in result["energy_over_time"].items():
-                time_series_agg["energy"][t].append(val)
-            
-            # print(f"  Iteration {i+1}/{iterations_per_count} complete.") # Keep simulation progress visible
-
-        # --- Aggregate and store the results for this user count ---
-        # Data for "vs Users" plot (Sensor Access, Energy, AoI)
-        experiment_results["vs_users"][num_users] = {
-            "avg_sensor_accesses": np.mean(run_totals["sensor_accesses"]),
-            "std_sensor_accesses": np.std(run_totals["sensor_accesses"]),
-            "avg_energy_consumed": np.mean(run_totals["energy_consumed"]),
-            "std_energy_consumed": np.std(run_totals["energy_consumed"]),
-            "avg_aoi_for_qos": np.mean(run_totals["avg_aoi"]),
-            "std_aoi_for_qos": np.std(run_totals["avg_aoi"])
-        }
-        
-        # Data for "vs Time" plot (Sensor Access, Energy)
-        sorted_time_steps = sorted(time_series_agg["accesses"].keys())
-        experiment_results["vs_time"][num_users] = {
-            "time_steps": sorted_time_steps,
-            "avg_sensor_accesses_over_time": [np.mean(time_series_agg["accesses"][t]) for t in sorted_time_steps],
-            "avg_energy_over_time": [np.mean(time_series_agg["energy"][t]) for t in sorted_time_steps]
-        }
-        
-        # Data for "Requests vs Time" plot
-        sorted_req_time_steps = sorted(time_series_agg["requests"].keys())
-        experiment_results["vs_time_requests"][num_users] = {
-            "time_steps": sorted_req_time_steps,
-            "avg_requests_over_time": [np.mean(time_series_agg["requests"][t]) for t in sorted_req_time_steps]
-        }
+    # Every (num_users, iteration) task generates its own mobility events and replays them
+    # through the online simulator; the results are aggregated per user count into the
+    # "vs_users", "vs_time" and "vs_time_requests" entries used for plotting.
+    if compare_ttl is None:
+        policies = None
+        online_options = {"cache_capacity": cache_capacity, "coalesce": coalesce,
+                          "aoi_histogram": aoi_percentiles, "aoi_model": aoi_model}
+        if cache_capacity is not None:
+            # Eviction only matters for a bounded cache; keeping it out otherwise keeps the checkpoint key stable
+            online_options["eviction"] = eviction
+    elif cache_capacity is not None:
+        raise ValueError("The scheme comparison runs with an unbounded cache; drop cache_capacity")
+    else:
+        # Scheme comparison: one pass per trace over every scheme (batched engine, unbounded cache)
+        policies = default_policies(master_policies, ttl=compare_ttl)
+        online_options = {"coalesce": coalesce, "aoi_histogram": aoi_percentiles, "aoi_model": aoi_model}
+    if results_dir is None:
+        experiment_results = run_sweep(
+            user_counts_to_simulate, iterations_per_count, master_policies, param_classifications,
+            workers=workers, chunksize=chunksize, base_seed=seed, sim_params=sim_params,
+            online_options=online_options, policies=policies, profile_path=profile_path
+        )
+    else:
+        grid = SweepGrid(user_counts_to_simulate, iterations_per_count)
+        results_by_config = run_scheduled_sweep(
+            grid, master_policies, param_classifications, results_dir=results_dir,
+            workers=workers, chunksize=chunksize, base_seed=seed, sim_params=sim_params,
+            online_options=online_options, policies=policies, profile_path=profile_path
+        )
+        # The default grid has a single deployment configuration
+        experiment_results, = results_by_config.values()
     
     print("\n--- All Experiments Complete ---")
     
@@ -123,6 +107,41 @@ def main():
 
 
 if __name__ == "__main__":
-    # Ensure necessary modules are imported correctly when running main
-    from simulation.guass_morkov import run_simulation # Required by main() for event generation
-    main()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Run the offline phase and the online simulation sweep.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes for the sweep (0 = all cores, default: 1 = serial).")
+    parser.add_argument("--chunksize", type=int, default=1,
+                        help="(num_users, iteration) tasks handed to a worker at a time.")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Base seed for brain generation and every iteration's random stream.")
+    parser.add_argument("--cache-capacity", type=int, default=None,
+                        help="Max (sensor, param) entries held by the edge cache (default: unbounded).")
+    parser.add_argument("--eviction", choices=("lru", "lfu", "aoi"), default="lru",
+                        help="Eviction policy used when the bounded cache is full.")
+    parser.add_argument("--coalesce", action="store_true",
+                        help="Fetch each (sensor, param) at most once per time step and share the read.")
+    parser.add_argument("--compare-ttl", type=int, default=None,
+                        help="Compare A2C-Safe against Static TTL (this TTL) and No Caching on the same traces.")
+    parser.add_argument("--aoi-percentiles", action="store_true",
+                        help="Also report p50/p95/p99 of the AoI seen at decision time.")
+    parser.add_argument("--results-dir", default=None,
+                        help="Checkpoint finished cells in this directory and resume from it (default: off).")
+    parser.add_argument("--user-counts", type=int, nargs="+", default=None,
+                        help="User counts to sweep (default: 50 75 100 125 150 175 200).")
+    parser.add_argument("--iterations", type=int, default=100,
+                        help="Iterations per user count (default: 100).")
+    parser.add_argument("--profile", default=None, metavar="PATH",
+                        help="Append per-stage timers/counters of the offline phase and every iteration to PATH.")
+    parser.add_argument("--aoi-model", choices=("lookup", "time"), default="lookup",
+                        help="Age cached entries per lookup (default) or by elapsed time steps.")
+    parser.add_argument("--dq-catalog", default=None, metavar="PATH",
+                        help="JSON recipe catalog to use instead of the built-in DECISION_RECIPES.")
+    parser.add_argument("--dq-zipf", type=float, default=None,
+                        help="Zipf exponent of the DQ popularity (default: uniform).")
+    args = parser.parse_args()
+    main(workers=args.workers or None, chunksize=args.chunksize, seed=args.seed,
+         cache_capacity=args.cache_capacity, eviction=args.eviction, coalesce=args.coalesce,
+         compare_ttl=args.compare_ttl, aoi_percentiles=args.aoi_percentiles,
+         results_dir=args.results_dir or None, user_counts=args.user_counts, iterations=args.iterations,
+         profile_path=args.profile, aoi_model=args.aoi_model, dq_catalog=args.dq_catalog, dq_zipf=args.dq_zipf)
\ No newline at end of file
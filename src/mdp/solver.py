@@ -1,6 +1,8 @@
 import numpy as np
 import json
 import os
+import hashlib
+import zlib
 import pandas as pd
 from collections import defaultdict
 import math # Import math for simple utilities
@@ -11,7 +13,9 @@ from analysis.scoring import (
     get_criticality_scores,
     categorize_scores,
 )
-from simulation.config import DECISION_RECIPES
+from simulation.recipes import DEFAULT_CATALOG
+from simulation.cache_store import policy_threshold
+from simulation.instrumentation import ensure_profiler
 
 # ==============================================================================
 # HELPER FUNCTIONS FOR ALGORITHM 2 (Category-Based MDP Policy Generation)
@@ -41,14 +45,35 @@ def scale_score(score, min_score, max_score, min_range, max_range):
 # MDP SOLVER (Original code preserved)
 # ==============================================================================
 
-def solve_mdp(alpha, beta, resource_cost=50, max_aoi=100, gamma=0.95, epsilon=1e-4):
-    """Solves for the optimal caching policy using Value Iteration."""
+def solve_mdp(alpha, beta, resource_cost=50, max_aoi=100, gamma=0.95, epsilon=1e-4, method="loop", profiler=None):
+    """
+    Solves for the optimal caching policy using Value Iteration.
+
+    method="loop" runs the original per-state loop; method="vectorized" runs the same
+    iteration with NumPy through solve_mdp_batch. profiler records the solve time
+    ("mdp.solve") and the sweeps until convergence ("mdp.sweeps").
+    """
+    if method == "vectorized":
+        return solve_mdp_batch([alpha], [beta], resource_cost, max_aoi, gamma, epsilon, profiler=profiler)[0]
+    if method != "loop":
+        raise ValueError(f"Unknown solve_mdp method: {method!r}")
+    profiler = ensure_profiler(profiler)
+    with profiler.timer("mdp.solve"):
+        policy, sweeps = _solve_mdp_loop(alpha, beta, resource_cost, max_aoi, gamma, epsilon)
+    profiler.count("mdp.pairs")
+    profiler.count("mdp.sweeps", sweeps)
+    return policy
+
+def _solve_mdp_loop(alpha, beta, resource_cost, max_aoi, gamma, epsilon):
+    """The original per-state Value Iteration loop. Returns (policy, number of sweeps)."""
     # ... (code for solve_mdp remains as it was) ...
     states = np.arange(1, max_aoi + 1)
     num_states = len(states)
     V = np.zeros(num_states)
+    sweeps = 0
     
     while True:
+        sweeps += 1
         delta = 0
         for s_idx, s_aoi in enumerate(states):
             # Cost function: Cost(s_AoI) = beta * (s_AoI)**alpha
@@ -74,64 +99,362 @@ def solve_mdp(alpha, beta, resource_cost=50, max_aoi=100, gamma=0.95, epsilon=1e
         v_fetch = cost_fetch + gamma * V[next_s_fetch_idx]
         policy[s_idx] = 1 if v_fetch < v_cache else 0
             
-    return policy
+    return policy, sweeps
+
+# ==============================================================================
+# VECTORIZED / BATCHED MDP SOLVER
+# ==============================================================================
+
+def solve_mdp_batch(alphas, betas, resource_cost=50, max_aoi=100, gamma=0.95, epsilon=1e-4, return_sweeps=False,
+                    profiler=None):
+    """
+    Solves the caching MDP for a batch of (alpha, beta) pairs at once.
+
+    Performs the same in-place (Gauss-Seidel) Value Iteration sweep as solve_mdp, but as
+    whole-state-vector NumPy operations on a pairs x states value matrix. Within a sweep
+    only state 1 (index 0) is updated before the others read it, so the sweep splits into
+    one update of V[:, 0] followed by one vector update of V[:, 1:]. Each pair stops
+    updating once its own sweep converges, like separate solve_mdp calls would.
+
+    Returns:
+        np.ndarray: pairs x max_aoi array of actions (1 = FETCH, 0 = CACHE).
+        With return_sweeps=True, a tuple (actions, sweeps) where sweeps[i] is the number of
+        Value Iteration sweeps pair i took (the same count solve_mdp needs for that pair).
+    profiler records the solve time and the pairs / sweeps as in solve_mdp.
+    """
+    profiler = ensure_profiler(profiler)
+    with profiler.timer("mdp.solve"):
+        policies, sweeps = _solve_mdp_batch(alphas, betas, resource_cost, max_aoi, gamma, epsilon)
+    profiler.count("mdp.pairs", len(sweeps))
+    profiler.count("mdp.sweeps", int(sweeps.sum()))
+    if return_sweeps:
+        return policies, sweeps
+    return policies
+
+def _solve_mdp_batch(alphas, betas, resource_cost, max_aoi, gamma, epsilon):
+    """Vectorized Gauss-Seidel Value Iteration behind solve_mdp_batch. Returns (policies, sweeps)."""
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    betas = np.atleast_1d(np.asarray(betas, dtype=float))
+    states = np.arange(1, max_aoi + 1)
+    num_states = len(states)
+    sweeps = np.zeros(len(alphas), dtype=np.int64)
+
+    # Cost function: Cost(s_AoI) = beta * (s_AoI)**alpha, one row per pair
+    cost_cache = betas[:, None] * (states[None, :] ** alphas[:, None])
+    next_s_cache_idx = np.minimum(np.arange(num_states) + 1, num_states - 1)
+    V = np.zeros((len(alphas), num_states))
+    active = np.ones(len(alphas), dtype=bool)
+
+    while active.any():
+        V_act = V[active]
+        c_act = cost_cache[active]
+        V_new = np.empty_like(V_act)
+        # State index 0 first: it reads its own old value and the old value of index 1
+        V_new[:, 0] = np.minimum(c_act[:, 0] + gamma * V_act[:, next_s_cache_idx[0]],
+                                 resource_cost + gamma * V_act[:, 0])
+        # Every other state reads the old value of its successor and the new value of index 0
+        V_new[:, 1:] = np.minimum(c_act[:, 1:] + gamma * V_act[:, next_s_cache_idx[1:]],
+                                  (resource_cost + gamma * V_new[:, 0])[:, None])
+        delta = np.max(np.abs(V_act - V_new), axis=1)
+        V[active] = V_new
+        sweeps[active] += 1
+        active[np.flatnonzero(active)[delta < epsilon]] = False
+
+    v_cache = cost_cache + gamma * V[:, next_s_cache_idx]
+    v_fetch = resource_cost + gamma * V[:, :1]
+    return np.where(v_fetch < v_cache, 1, 0), sweeps
+
+# ==============================================================================
+# THRESHOLD-STRUCTURE FAST PATH
+# ==============================================================================
+
+def solve_mdp_threshold_batch(alphas, betas, resource_cost=50, max_aoi=100, gamma=0.95):
+    """
+    Solves the caching MDP for a batch of (alpha, beta) pairs by searching over threshold policies.
+
+    The cost beta * s**alpha grows with the AoI while FETCH always costs resource_cost and resets
+    the AoI to 1, so the optimal policy caches below some AoI k and fetches from k on. The value
+    of state 1 under threshold k has a closed form:
+
+        V_k(1) = (sum_{j<k} gamma**(j-1) * c(j) + gamma**(k-1) * R) / (1 - gamma**k)
+
+    and k = max_aoi + 1 ("never fetch", the last state loops on itself) is
+    sum_{j<N} gamma**(j-1) * c(j) + gamma**(N-1) * c(N) / (1 - gamma). All thresholds are
+    evaluated with cumulative sums, the best one is picked per pair, and no iteration (or
+    epsilon) is involved.
+
+    Returns:
+        tuple: (policies, thresholds) -- a pairs x max_aoi action array (1 = FETCH, 0 = CACHE)
+               and, per pair, the AoI from which the policy fetches (max_aoi + 1 = never).
+    """
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    betas = np.atleast_1d(np.asarray(betas, dtype=float))
+    states = np.arange(1, max_aoi + 1)
+
+    cost = betas[:, None] * (states[None, :] ** alphas[:, None])
+    discount = gamma ** np.arange(max_aoi)  # gamma**(s-1) for s = 1..N
+    # discounted_cost[:, k-1] = sum_{j<k} gamma**(j-1) * c(j)
+    discounted_cost = np.concatenate(
+        [np.zeros((len(alphas), 1)), np.cumsum(discount * cost, axis=1)], axis=1
+    )
+
+    value_fetch_at_k = (discounted_cost[:, :max_aoi] + discount * resource_cost) / (1 - gamma * discount)
+    value_never = discounted_cost[:, max_aoi - 1] + discount[-1] * cost[:, -1] / (1 - gamma)
+    values = np.concatenate([value_fetch_at_k, value_never[:, None]], axis=1)
+
+    thresholds = np.argmin(values, axis=1) + 1
+    policies = (states[None, :] >= thresholds[:, None]).astype(int)
+    return policies, thresholds
+
+def solve_mdp_threshold(alpha, beta, resource_cost=50, max_aoi=100, gamma=0.95):
+    """Single-pair version of solve_mdp_threshold_batch. Returns (policy, threshold)."""
+    policies, thresholds = solve_mdp_threshold_batch([alpha], [beta], resource_cost, max_aoi, gamma)
+    return policies[0], int(thresholds[0])
+
+# ==============================================================================
+# BRAIN ARTIFACT (content-addressed .npz cache)
+# ==============================================================================
+"""
+The brain is stored as a single .npz file holding plain arrays: the stacked policies,
+their thresholds, the category table and the parameter -> category index table. It
+is loaded without eval or pickle. The file name is derived from a hash of every input
+that affects the brain (recipes, scaling ranges, solver and its parameters, seed), so
+changing any of them automatically leads to a rebuild.
+"""
+BRAIN_FORMAT_VERSION = 2
+
+# Target output ranges for the scaled MDP parameters (alpha_min/max, beta_min/max).
+# Based on typical MDP applications and the prior hardcoded grid values (1.1 to 3.0 for alpha, 0.1 to 1.5 for beta)
+ALPHA_RANGE = (1.1, 3.0)
+BETA_RANGE = (0.1, 1.5)
+
+# Parameters every category MDP is solved with
+MDP_SOLVER_PARAMS = {"resource_cost": 50, "max_aoi": 100, "gamma": 0.95, "epsilon": 1e-4}
+
+def brain_cache_key(seed=None, solver="value_iteration", catalog=None):
+    """SHA-256 over every input that affects the generated brain (catalog=None: the built-in recipes)."""
+    inputs = {
+        "format_version": BRAIN_FORMAT_VERSION,
+        "decision_recipes": (catalog or DEFAULT_CATALOG).recipes,
+        "alpha_range": ALPHA_RANGE,
+        "beta_range": BETA_RANGE,
+        "solver": solver,
+        "solver_params": MDP_SOLVER_PARAMS,
+        "seed": seed,
+    }
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def solver_cache_key(solver="value_iteration"):
+    """
+    SHA-256 over the inputs that map a category's (alpha, beta) to its policy. Two brains with
+    the same solver key can share the policy of any category whose (alpha, beta) is unchanged.
+    """
+    inputs = {"format_version": BRAIN_FORMAT_VERSION, "solver": solver, "solver_params": MDP_SOLVER_PARAMS}
+    canonical = json.dumps(inputs, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def brain_path_for_key(brain_dir, key):
+    return os.path.join(brain_dir, f"brain_{key[:16]}.npz")
+
+def save_brain(path, key, master_policies, param_classifications, category_params,
+               volatility_scores, criticality_scores, solver_key):
+    """Writes the brain as an .npz of plain (non-object) arrays, atomically."""
+    categories = list(master_policies.keys())
+    category_row = {category: row for row, category in enumerate(categories)}
+    params = sorted(param_classifications.keys())
+    thresholds = [policy_threshold(master_policies[c]) for c in categories]
+
+    arrays = {
+        "key": np.array(key),
+        "categories": np.array(categories, dtype=str).reshape(len(categories), 2),
+        "policies": np.stack([np.asarray(master_policies[c], dtype=np.int8) for c in categories]),
+        # 0 marks a policy that is not threshold-shaped
+        "thresholds": np.array([t if t is not None else 0 for t in thresholds], dtype=np.int32),
+        "category_alpha_beta": np.array([category_params[c] for c in categories], dtype=float),
+        "params": np.array(params, dtype=str),
+        "param_category": np.array([category_row[tuple(param_classifications[p])] for p in params], dtype=np.int32),
+        # Inputs kept for incremental regeneration
+        "volatility_scores": np.array([volatility_scores[p] for p in params], dtype=float),
+        "criticality_scores": np.array([criticality_scores[p] for p in params], dtype=float),
+        "solver_key": np.array(solver_key),
+    }
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def load_brain(path):
+    """
+    Loads a brain written by save_brain.
+
+    Returns:
+        tuple: (master_policies, param_classifications, brain_arrays) where brain_arrays is
+               the dict of raw arrays (thresholds, category_alpha_beta, key, ...).
+    """
+    with np.load(path, allow_pickle=False) as archive:
+        brain_arrays = {name: archive[name] for name in archive.files}
+    categories = [tuple(row) for row in brain_arrays["categories"].tolist()]
+    master_policies = {c: brain_arrays["policies"][i].astype(int) for i, c in enumerate(categories)}
+    param_classifications = {
+        p: categories[c] for p, c in zip(brain_arrays["params"].tolist(), brain_arrays["param_category"].tolist())
+    }
+    return master_policies, param_classifications, brain_arrays
+
+def find_reusable_brain(brain_dir, solver_key, exclude_path=None):
+    """
+    Returns the raw arrays of the most recently written brain in brain_dir that was solved with
+    the same solver key (see solver_cache_key), or None if there is none.
+    """
+    if not os.path.isdir(brain_dir):
+        return None
+    candidates = [
+        os.path.join(brain_dir, name) for name in os.listdir(brain_dir)
+        if name.startswith("brain_") and name.endswith(".npz")
+    ]
+    for path in sorted(candidates, key=os.path.getmtime, reverse=True):
+        if exclude_path is not None and os.path.abspath(path) == os.path.abspath(exclude_path):
+            continue
+        try:
+            _, _, brain_arrays = load_brain(path)
+        except (OSError, ValueError, KeyError):
+            continue
+        if "solver_key" in brain_arrays and str(brain_arrays["solver_key"]) == solver_key:
+            return brain_arrays
+    return None
+
+def report_score_changes(previous_brain, volatility_scores, criticality_scores):
+    """Prints which parameters were added, removed or re-scored since the previous brain."""
+    previous_params = previous_brain["params"].tolist()
+    previous_scores = {
+        p: (v, c) for p, v, c in zip(previous_params, previous_brain["volatility_scores"].tolist(),
+                                     previous_brain["criticality_scores"].tolist())
+    }
+    added = [p for p in volatility_scores if p not in previous_scores]
+    removed = [p for p in previous_scores if p not in volatility_scores]
+    rescored = [
+        p for p in volatility_scores
+        if p in previous_scores and previous_scores[p] != (volatility_scores[p], criticality_scores[p])
+    ]
+    print(f"Parameters since the previous brain: {len(added)} added, {len(removed)} removed, "
+          f"{len(rescored)} re-scored.")
+    return added, removed, rescored
+
+def reuse_previous_policies(previous_brain, category_params, categories_to_params):
+    """
+    Returns {category: policy} for the categories whose policy the previous brain already holds.
+    A policy only depends on its (alpha, beta), so it is matched on that pair, whatever label the
+    category had before. Prints why each remaining category is re-solved: its parameter set
+    changed, or the same parameters were re-scored.
+    """
+    previous_categories = [tuple(c) for c in previous_brain["categories"].tolist()]
+    previous_policies = {
+        tuple(alpha_beta): previous_brain["policies"][row].astype(int)
+        for row, alpha_beta in enumerate(previous_brain["category_alpha_beta"].tolist())
+    }
+    previous_members = defaultdict(set)
+    for param, row in zip(previous_brain["params"].tolist(), previous_brain["param_category"].tolist()):
+        previous_members[previous_categories[row]].add(param)
+
+    reused = {}
+    for category, alpha_beta in category_params.items():
+        if alpha_beta in previous_policies:
+            reused[category] = previous_policies[alpha_beta]
+            continue
+        members = set(categories_to_params[category])
+        joined, left = members - previous_members[category], previous_members[category] - members
+        if joined or left:
+            reason = f"{len(joined)} parameter(s) joined, {len(left)} left"
+        else:
+            reason = "same parameters, re-scored"
+        print(f"  Re-solving {category}: {reason}.")
+    return reused
+
+def mock_historical_data(all_parameters, seed=None):
+    """
+    Mock time-series and accident data. Every parameter draws from its own stream keyed by its
+    name, so adding or removing a parameter leaves the other parameters' data unchanged.
+    """
+    def stream(name):
+        return np.random.default_rng(np.random.SeedSequence(entropy=seed, spawn_key=(zlib.crc32(name.encode()),)))
+
+    time_series_data = {p: stream(f"ts:{p}").normal(50, 10, 1000) for p in all_parameters}
+    accident_df_data = {p: stream(f"acc:{p}").random(500) for p in all_parameters}
+    accident_df_data['Accident_Severity'] = stream("acc:Accident_Severity").integers(0, 3, 500)
+    return time_series_data, pd.DataFrame(accident_df_data)
 
 # ==============================================================================
 # MASTER FUNCTION TO GET OR GENERATE THE BRAIN (Modified for Algorithm 2)
 # ==============================================================================
-def get_or_generate_brain(policy_path="master_policies.json", classification_path="param_classifications.json"):
+def get_or_generate_brain(brain_dir="brain_cache", seed=None, solver="value_iteration", incremental=True,
+                          profiler=None, catalog=None):
     """
-    Checks if policy and classification files exist. If yes, loads them.
-    If not, it runs the entire offline generation process and saves the files.
+    Loads the brain for the current inputs from brain_dir if it exists.
+    If not, it runs the entire offline generation process and saves the brain there.
+    `seed` fixes the random generator used for the mock historical data.
+    `solver` selects batched "value_iteration" or the closed-form "threshold" search.
+    With `incremental`, the most recent brain solved with the same solver settings is reused:
+    only categories whose (alpha, beta) changed are re-solved.
+    catalog (recipes.RecipeCatalog, default: the built-in DECISION_RECIPES) decides which
+    parameters are characterized and classified.
+    profiler times loading ("offline.load_brain"), parameter characterization
+    ("offline.characterization") and the MDP solves, and counts value-iteration sweeps.
     
     Returns:
         tuple: (master_policies, param_classifications)
     """
     print("--- Checking for existing brain files... ---")
-    
-    # Check if both files exist (Loading logic remains the same)
-    if os.path.exists(policy_path) and os.path.exists(classification_path):
+    profiler = ensure_profiler(profiler)
+
+    catalog = catalog or DEFAULT_CATALOG
+    key = brain_cache_key(seed, solver, catalog)
+    brain_path = brain_path_for_key(brain_dir, key)
+
+    # A brain built from the same inputs already exists
+    if os.path.exists(brain_path):
         print("Brain files found! Loading from cache... 🧠")
-        with open(policy_path, 'r') as f:
-            master_policies_str_keys = json.load(f)
-            master_policies = {eval(k): np.array(v) for k, v in master_policies_str_keys.items()}
-        with open(classification_path, 'r') as f:
-            param_classifications = json.load(f)
-        
-        print("Brain loaded successfully.")
-        return master_policies, param_classifications
+        with profiler.timer("offline.load_brain"):
+            master_policies, param_classifications, brain_arrays = load_brain(brain_path)
+        if str(brain_arrays["key"]) == key:
+            print("Brain loaded successfully.")
+            return master_policies, param_classifications
+        print("Brain file does not match the current inputs; regenerating.")
 
     # --- If files don't exist, generate everything ---
     print("Brain files not found. Starting offline generation process...")
 
     # 1. Get all parameters
-    all_params_set = {param for recipe in DECISION_RECIPES.values() for param in recipe['parameters']}
-    ALL_PARAMETERS = sorted(list(all_params_set))
-
-    # 2. Generate mock data (or load real data)
-    time_series_data = {p: np.random.normal(50, 10, 1000) for p in ALL_PARAMETERS}
-    accident_df_data = {p: np.random.rand(500) for p in ALL_PARAMETERS}
-    accident_df_data['Accident_Severity'] = np.random.randint(0, 3, 500)
-    accident_data = pd.DataFrame(accident_df_data)
-    
-    # 3. Analyze and categorize parameters
-    # This section now corresponds to Algorithm 1 (Offline Parameter Characterization)
-    print("Analyzing and categorizing parameters...")
-    volatility_scores = {p: calculate_volatility_score(time_series_data[p]) for p in ALL_PARAMETERS} # S_vol
-    criticality_scores = get_criticality_scores(ALL_PARAMETERS, accident_data) # S_crit
+    ALL_PARAMETERS = list(catalog.param_names)
+
+    with profiler.timer("offline.characterization"):
+        # 2. Generate mock data (or load real data)
+        time_series_data, accident_data = mock_historical_data(ALL_PARAMETERS, seed)
+        
+        # 3. Analyze and categorize parameters
+        # This section now corresponds to Algorithm 1 (Offline Parameter Characterization)
+        print("Analyzing and categorizing parameters...")
+        volatility_scores = {p: calculate_volatility_score(time_series_data[p]) for p in ALL_PARAMETERS} # S_vol
+        # Trees are built on all cores; importances are cached next to the brain and only
+        # retrained when the accident data or the parameter list changes.
+        criticality_scores = get_criticality_scores(ALL_PARAMETERS, accident_data, n_jobs=-1, cache_dir=brain_dir) # S_crit
     
     # Generate the classification map C_map
     vol_class = categorize_scores(volatility_scores)
     crit_class = categorize_scores(criticality_scores)
     param_classifications = {p: (vol_class[p], crit_class[p]) for p in ALL_PARAMETERS} 
 
+    # Previous brain solved with the same solver settings, for incremental regeneration
+    solver_key = solver_cache_key(solver)
+    previous_brain = find_reusable_brain(brain_dir, solver_key, exclude_path=brain_path) if incremental else None
+    if previous_brain is not None:
+        report_score_changes(previous_brain, volatility_scores, criticality_scores)
+
     # --- START OF ALGORITHM 2 LOGIC ---
     print("Generating master policies dynamically...")
 
-    # 4a. Define Target Output Ranges (alpha_min/max, beta_min/max)
-    # Based on typical MDP applications and the prior hardcoded grid values (1.1 to 3.0 for alpha, 0.1 to 1.5 for beta)
-    ALPHA_RANGE = (1.1, 3.0) 
-    BETA_RANGE = (0.1, 1.5)
+    # 4a. Target output ranges are ALPHA_RANGE / BETA_RANGE (module level, part of the cache key)
 
     # 4b. Find Global Min/Max boundaries of the raw scores for normalization
     all_vol_scores = list(volatility_scores.values())
@@ -146,6 +469,7 @@ def get_or_generate_brain(policy_path="master_policies.json", classification_pat
         categories_to_params[category_tuple].append(param)
         
     master_policies = {}
+    category_params = {}  # category -> (alpha_c, beta_c)
 
     # 4d. Loop through unique categories (Algorithm 2, step: FOR each category c)
     for category_tuple, param_list in categories_to_params.items():
@@ -162,22 +486,43 @@ def get_or_generate_brain(policy_path="master_policies.json", classification_pat
             avg_crit_for_category, min_crit, max_crit, *BETA_RANGE
         )
 
-        # --- Algorithm 2, Step: Solve the MDP using Value Iteration (SolveMDP) ---
-        # Note: The MDP solver implicitly uses the derived alpha/beta to define the cost function:
-        # Cost(s_AoI) <- beta_c * (s_AoI)**alpha_c
-        policy = solve_mdp(alpha=alpha_c, beta=beta_c)
-        
-        # --- Algorithm 2, Step: Store the resulting optimal policy ---
+        category_params[category_tuple] = (alpha_c, beta_c)
+
+    # --- Algorithm 2, Step: Solve the MDP using Value Iteration (SolveMDP) ---
+    # Note: The MDP solver implicitly uses the derived alpha/beta to define the cost function:
+    # Cost(s_AoI) <- beta_c * (s_AoI)**alpha_c
+    # Categories whose (alpha, beta) the previous brain already solved keep that policy;
+    # all others are solved together as one batch of (alpha, beta) pairs.
+    if previous_brain is not None:
+        master_policies.update(reuse_previous_policies(previous_brain, category_params, categories_to_params))
+    categories = [c for c in category_params if c not in master_policies]
+    print(f"Solving {len(categories)} of {len(category_params)} category MDPs "
+          f"({len(category_params) - len(categories)} reused).")
+
+    category_alphas = [category_params[c][0] for c in categories]
+    category_betas = [category_params[c][1] for c in categories]
+    solver_params = dict(MDP_SOLVER_PARAMS)
+    if solver not in ("threshold", "value_iteration"):
+        raise ValueError(f"Unknown solver: {solver!r}")
+    if not categories:
+        policies = []
+    elif solver == "threshold":
+        solver_params.pop("epsilon")
+        with profiler.timer("mdp.solve"):
+            policies, _ = solve_mdp_threshold_batch(category_alphas, category_betas, **solver_params)
+        profiler.count("mdp.pairs", len(categories))
+    else:
+        policies = solve_mdp_batch(category_alphas, category_betas, **solver_params, profiler=profiler)
+
+    # --- Algorithm 2, Step: Store the resulting optimal policy ---
+    for category_tuple, policy in zip(categories, policies):
         master_policies[category_tuple] = policy
+    master_policies = {c: master_policies[c] for c in category_params}
         
-    # 5. Save the generated brain to files for next time
+    # 5. Save the generated brain for next time
     print("Saving brain files... 💾")
-    with open(classification_path, 'w') as f:
-        json.dump(param_classifications, f, indent=2)
-    
-    policies_to_save = {str(key): policy.tolist() for key, policy in master_policies.items()}
-    with open(policy_path, 'w') as f:
-        json.dump(policies_to_save, f, indent=2)
+    save_brain(brain_path, key, master_policies, param_classifications, category_params,
+               volatility_scores, criticality_scores, solver_key)
         
     print("Brain generation and saving complete.")
     return master_policies, param_classifications
\ No newline at end of file
@@ -0,0 +1,270 @@
+# File: sem7/src/service/decision_service.py
+
+import time
+import asyncio
+import numpy as np
+
+from simulation.cache_store import AoICacheStore, NEVER_FETCHED, ACTION_FETCH, compile_policy_table
+from simulation.online_simulator import (MAX_AOI, COST_SENSOR_FETCH_ENERGY, COST_CACHE_LOOKUP_ENERGY,
+                                         TIME_SENSOR_FETCH_MS, TIME_CACHE_LOOKUP_MS)
+from simulation.recipes import DEFAULT_CATALOG, resolve_catalog
+from simulation.sensor_index import build_sensor_index
+from simulation.trace import as_request_trace
+from simulation.rng import ensure_rng
+
+# ==============================================================================
+# LIVE DECISION-QUERY SERVICE (ASYNCIO) WITH LATENCY TRACKING
+# ==============================================================================
+"""
+Serves DQ requests live instead of replaying them: a request (user x, y, DQ numbers) is
+mapped to its nearest sensor, every parameter of its DECISION_RECIPES is looked up in the
+edge cache, and the brain decides per parameter whether to serve the cached value or
+fetch a fresh one from the sensor backend. Fetches of one request run concurrently, and a
+key that is already being fetched is not fetched twice: later requests await the
+in-flight read (single flight).
+
+Entries age with the service clock (the "time" AoI model of cache_store.py): AoI is
+measured in time steps of `step_seconds`, or in the time steps carried by the requests
+when a trace is replayed. Each request's end-to-end latency is recorded, and stats()
+reports p50/p95/p99 latency and throughput next to the usual energy counters.
+
+The load generator replays a run_simulation trace against the service, issuing all
+requests of a time step concurrently. Run it from src/:
+
+    python -m service.decision_service --users 200 --duration 20
+"""
+LATENCY_PERCENTILES = (50, 95, 99)
+
+class SensorBackend:
+    """Interface of the sensor side: fetch() returns the current reading of one parameter of one sensor."""
+
+    async def fetch(self, sensor_id, param):
+        raise NotImplementedError
+
+class StubSensorBackend(SensorBackend):
+    """Local backend that sleeps for the modeled fetch latency (plus optional jitter) and returns a random reading."""
+
+    def __init__(self, latency_ms=TIME_SENSOR_FETCH_MS, jitter_ms=0.0, rng=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rng = ensure_rng(rng)
+        self.fetches = 0
+
+    async def fetch(self, sensor_id, param):
+        self.fetches += 1
+        delay_ms = self.latency_ms + (self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        await asyncio.sleep(delay_ms / 1000.0)
+        return float(self.rng.random())
+
+class LatencyRecorder:
+    """Request latencies (seconds) and the wall-clock window they were recorded in."""
+
+    def __init__(self):
+        self.latencies = []
+        self.first_start = None
+        self.last_end = None
+
+    def record(self, start, end):
+        self.latencies.append(end - start)
+        self.first_start = start if self.first_start is None else min(self.first_start, start)
+        self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def summary(self):
+        """Count, throughput (requests/s) and p50/p95/p99 latency in milliseconds."""
+        summary = {"requests": len(self.latencies), "throughput_rps": 0.0}
+        if not self.latencies:
+            summary.update({f"p{q}_latency_ms": 0.0 for q in LATENCY_PERCENTILES})
+            return summary
+        elapsed = self.last_end - self.first_start
+        if elapsed > 0:
+            summary["throughput_rps"] = len(self.latencies) / elapsed
+        percentiles = np.percentile(np.asarray(self.latencies) * 1000.0, LATENCY_PERCENTILES)
+        summary.update({f"p{q}_latency_ms": float(v) for q, v in zip(LATENCY_PERCENTILES, percentiles)})
+        return summary
+
+class DecisionService:
+    """
+    Answers DQ requests from the edge cache or the sensor backend, following the brain.
+
+    static_sensors is the sensor layout ({'x': [...], 'y': [...]}); backend a SensorBackend.
+    lookup_latency_ms models the cache read, paid once per request that is served (partly)
+    from the cache. max_concurrent_fetches caps the backend fetches in flight (None = no cap).
+    catalog (recipes.RecipeCatalog) maps DQ numbers to parameters.
+    """
+
+    def __init__(self, master_policies, param_classifications, static_sensors, backend,
+                 step_seconds=1.0, lookup_latency_ms=TIME_CACHE_LOOKUP_MS, max_concurrent_fetches=None,
+                 catalog=DEFAULT_CATALOG):
+        self.catalog = catalog
+        self.param_names = catalog.param_names
+        self.policy_table = compile_policy_table(master_policies, param_classifications, self.param_names, MAX_AOI)
+        self.sensor_index = build_sensor_index(static_sensors)
+        self.store = AoICacheStore(len(self.sensor_index), len(self.param_names), aoi_model="time")
+        self.values = {}  # (sensor_id, param_idx) -> last fetched reading
+        self.in_flight = {}  # (sensor_id, param_idx) -> Task of the fetch under way
+        self.backend = backend
+        self.step_seconds = step_seconds
+        self.lookup_latency_ms = lookup_latency_ms
+        self.fetch_slots = asyncio.Semaphore(max_concurrent_fetches) if max_concurrent_fetches else None
+        self.started_at = time.perf_counter()
+        self.latency = LatencyRecorder()
+        self.counters = {"lookups": 0, "hits": 0, "fetches": 0, "coalesced": 0, "failed_requests": 0}
+        self.total_energy_consumed = 0.0
+
+    def current_time_step(self):
+        return int((time.perf_counter() - self.started_at) / self.step_seconds)
+
+    def current_aoi(self, sensor_id, param_idx, time_step):
+        """AoI of a cached entry at time_step (MAX_AOI if never fetched)."""
+        fetched_at = self.store.fetched_at[sensor_id, param_idx]
+        if fetched_at == NEVER_FETCHED:
+            return MAX_AOI
+        return min(max(time_step - int(fetched_at), 1), MAX_AOI)
+
+    async def _fetch(self, sensor_id, param_idx, time_step):
+        if self.fetch_slots is None:
+            value = await self.backend.fetch(sensor_id, self.param_names[param_idx])
+        else:
+            async with self.fetch_slots:
+                value = await self.backend.fetch(sensor_id, self.param_names[param_idx])
+        self.values[(sensor_id, param_idx)] = value
+        self.store.fetched_at[sensor_id, param_idx] = time_step
+        return value
+
+    async def _fetch_once(self, key, time_step):
+        """Fetches `key`, or awaits the fetch of it that is already in flight."""
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return await asyncio.shield(task)
+        task = asyncio.ensure_future(self._fetch(key[0], key[1], time_step))
+        self.in_flight[key] = task
+        # The entry is dropped once the fetch ends, even if the requests awaiting it were cancelled
+        task.add_done_callback(lambda done: self.in_flight.pop(key, None))
+        self.counters["fetches"] += 1
+        self.total_energy_consumed += COST_SENSOR_FETCH_ENERGY
+        return await asyncio.shield(task)
+
+    async def handle_request(self, x, y, dq_list, time_step=None):
+        """
+        Serves one request and returns {dq: {param: (value, aoi)}}. time_step defaults to the
+        service clock; replayed traces pass their own time steps.
+        """
+        start = time.perf_counter()
+        if time_step is None:
+            time_step = self.current_time_step()
+        sensor_id, _ = self.sensor_index.nearest((x, y))
+
+        reads = {}  # param_idx -> (awaitable or value, aoi)
+        for dq in dq_list:
+            for param_idx in self.catalog.param_list(int(dq)):
+                if param_idx in reads:
+                    continue
+                key = (sensor_id, param_idx)
+                self.counters["lookups"] += 1
+                aoi = self.current_aoi(sensor_id, param_idx, time_step)
+                # A key being fetched right now is joined; a never-fetched key is always fetched
+                if (key in self.in_flight or key not in self.values
+                        or self.policy_table.action(param_idx, aoi) == ACTION_FETCH):
+                    reads[param_idx] = (self._fetch_once(key, time_step), 1)
+                else:
+                    self.counters["hits"] += 1
+                    self.total_energy_consumed += COST_CACHE_LOOKUP_ENERGY
+                    reads[param_idx] = (self.values[key], aoi)
+
+        pending = [read for read, _ in reads.values() if asyncio.iscoroutine(read)]
+        waits = list(pending)
+        if len(pending) < len(reads):
+            waits.append(asyncio.sleep(self.lookup_latency_ms / 1000.0))
+        try:
+            fetched = iter(await asyncio.gather(*waits))
+        except Exception:
+            self.counters["failed_requests"] += 1
+            raise
+        values = {
+            param_idx: (next(fetched) if asyncio.iscoroutine(read) else read, aoi)
+            for param_idx, (read, aoi) in reads.items()
+        }
+
+        response = {
+            int(dq): {self.param_names[p]: values[p] for p in self.catalog.param_list(int(dq))}
+            for dq in dq_list
+        }
+        self.latency.record(start, time.perf_counter())
+        return response
+
+    def stats(self):
+        """Latency/throughput summary plus lookup, fetch and energy counters."""
+        return dict(self.latency.summary(), **self.counters, total_energy_consumed=self.total_energy_consumed)
+
+async def replay_trace(service, simulation_events, step_seconds=0.0, max_concurrency=None):
+    """
+    Load generator: replays the requests of a run_simulation result against `service`.
+
+    All requests of a time step are issued concurrently (at most max_concurrency at a time)
+    with the trace's time step; step_seconds > 0 paces the steps in wall-clock time,
+    0 replays them back to back. Returns service.stats().
+    """
+    trace = as_request_trace(simulation_events["requests"])
+    limit = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+    async def issue(i):
+        if limit is None:
+            return await service.handle_request(float(trace.x[i]), float(trace.y[i]), trace.dq_list(i).tolist(),
+                                                int(trace.time_step[i]))
+        async with limit:
+            return await service.handle_request(float(trace.x[i]), float(trace.y[i]), trace.dq_list(i).tolist(),
+                                                int(trace.time_step[i]))
+
+    time_steps = np.asarray(trace.time_step)
+    bounds = np.flatnonzero(np.diff(time_steps)) + 1
+    loop = asyncio.get_running_loop()
+    replay_start = loop.time()
+    for rows in np.split(np.arange(len(time_steps)), bounds):
+        if len(rows) == 0:
+            continue
+        if step_seconds > 0:
+            await asyncio.sleep(max(0.0, replay_start + int(time_steps[rows[0]]) * step_seconds - loop.time()))
+        await asyncio.gather(*(issue(i) for i in rows.tolist()), return_exceptions=True)
+    return service.stats()
+
+def main():
+    import argparse
+    from mdp.solver import get_or_generate_brain
+    from simulation.guass_morkov import run_simulation
+
+    parser = argparse.ArgumentParser(description="Replay a simulated trace against the live decision service.")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--sensors", type=int, default=450)
+    parser.add_argument("--duration", type=int, default=20, help="Time steps to simulate.")
+    parser.add_argument("--step-seconds", type=float, default=0.0,
+                        help="Wall-clock seconds per time step (default: 0 = back to back).")
+    parser.add_argument("--fetch-ms", type=float, default=TIME_SENSOR_FETCH_MS, help="Stub sensor fetch latency.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra uniform fetch latency.")
+    parser.add_argument("--max-fetches", type=int, default=None, help="Cap on concurrent sensor fetches.")
+    parser.add_argument("--dq-catalog", default=None, metavar="PATH",
+                        help="JSON recipe catalog to use instead of the built-in DECISION_RECIPES.")
+    parser.add_argument("--dq-zipf", type=float, default=None, help="Zipf exponent of the DQ popularity.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    catalog = resolve_catalog(args.dq_catalog, args.dq_zipf)
+
+    master_policies, param_classifications = get_or_generate_brain(seed=args.seed, catalog=catalog)
+    simulation_events = run_simulation(
+        num_users=args.users, num_sensors=args.sensors, area=(0, 10000, 0, 10000),
+        duration=args.duration, mean_speed=15, alpha=0.75, trace_format="columnar", rng=args.seed,
+        catalog=catalog
+    )
+    print(f"Replaying {len(simulation_events['requests'])} requests over {args.duration} time steps...")
+
+    async def run():
+        backend = StubSensorBackend(args.fetch_ms, args.jitter_ms, rng=args.seed)
+        service = DecisionService(master_policies, param_classifications, simulation_events["static_sensors"],
+                                  backend, max_concurrent_fetches=args.max_fetches, catalog=catalog)
+        return await replay_trace(service, simulation_events, step_seconds=args.step_seconds)
+
+    for name, value in asyncio.run(run()).items():
+        print(f"  {name:<22} {value:.2f}" if isinstance(value, float) else f"  {name:<22} {value}")
+
+if __name__ == "__main__":
+    main()
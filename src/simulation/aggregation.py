@@ -0,0 +1,198 @@
+# File: sem7/src/simulation/aggregation.py
+
+import math
+import numpy as np
+from collections import defaultdict
+
+# ==============================================================================
+# STREAMING, MERGEABLE AGGREGATION OF ITERATION RESULTS
+# ==============================================================================
+"""
+The sweep used to keep every iteration's totals and every time step's values in
+lists and call np.mean / np.std at the end. Here every metric (and every time step
+of every series) is summarised by a running count / mean / M2 (Welford), which
+takes constant memory per metric and merges exactly like the statistics of the
+concatenated data (Chan et al.), so partial aggregates from separate processes can
+be combined. Means and population standard deviations agree with np.mean / np.std
+up to floating-point rounding.
+
+An optional AoI histogram (exact, since AoI is an integer in 1..MAX_AOI) gives
+tail percentiles of the AoI seen at decision time.
+"""
+class RunningStats:
+    """Count, mean and sum of squared deviations (M2) of a stream of numbers."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        # Same update as merging a one-value summary, so add() and merge() give identical results
+        self.merge_values(1, value, 0.0)
+
+    def merge(self, other):
+        self.merge_values(other.count, other.mean, other.m2)
+
+    def merge_values(self, count, mean, m2):
+        if count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = count, float(mean), float(m2)
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean = self.mean + delta * count / total
+        self.m2 = self.m2 + m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    @property
+    def std(self):
+        """Population standard deviation (np.std with ddof=0)."""
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
+    def to_list(self):
+        return [self.count, self.mean, self.m2]
+
+    @classmethod
+    def from_list(cls, values):
+        count, mean, m2 = values
+        return cls(count, mean, m2)
+
+class AoIHistogram:
+    """Counts of the AoI values seen at decision time; mergeable and exact."""
+
+    def __init__(self, counts=()):
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def merge(self, other):
+        other_counts = np.asarray(other.counts if isinstance(other, AoIHistogram) else other, dtype=np.int64)
+        size = max(len(self.counts), len(other_counts))
+        merged = np.zeros(size, dtype=np.int64)
+        merged[:len(self.counts)] += self.counts
+        merged[:len(other_counts)] += other_counts
+        self.counts = merged
+
+    def percentile(self, q):
+        """Smallest AoI with at least q percent of the samples at or below it."""
+        total = int(self.counts.sum())
+        if total == 0:
+            return 0
+        return int(np.searchsorted(np.cumsum(self.counts), math.ceil(total * q / 100.0)))
+
+AOI_PERCENTILES = (50, 95, 99)
+
+# Totals always reported by the online simulator: result key -> name in vs_users
+RUN_TOTALS = {
+    "total_sensor_accesses": "sensor_accesses",
+    "total_energy_consumed": "energy_consumed",
+    "avg_aoi_for_qos": "aoi_for_qos",
+}
+# Totals only reported by some online configurations (bounded cache, coalescing)
+OPTIONAL_RUN_TOTALS = {
+    "total_evictions": "evictions",
+    "total_fetch_demands": "fetch_demands",
+    "total_coalesced_lookups": "coalesced_lookups",
+}
+# Time series: result key -> series name
+RUN_SERIES = {
+    "accesses_over_time": "accesses",
+    "energy_over_time": "energy",
+    "requests_over_time": "requests",
+}
+
+class IterationAggregate:
+    """Mergeable summary of the iteration results of one user count (and one scheme)."""
+
+    def __init__(self):
+        self.totals = {name: RunningStats() for name in RUN_TOTALS.values()}
+        self.series = {name: defaultdict(RunningStats) for name in RUN_SERIES.values()}
+        self.aoi_histogram = None
+
+    @classmethod
+    def from_result(cls, result):
+        aggregate = cls()
+        aggregate.add(result)
+        return aggregate
+
+    def add(self, result):
+        """Adds one run_single_online_iteration result."""
+        for key, name in list(RUN_TOTALS.items()) + list(OPTIONAL_RUN_TOTALS.items()):
+            if key in result:
+                self.totals.setdefault(name, RunningStats()).add(result[key])
+        for key, name in RUN_SERIES.items():
+            series = self.series[name]
+            for t, val in result[key].items():
+                series[t].add(val)
+        if "aoi_histogram" in result:
+            self._merge_histogram(result["aoi_histogram"])
+
+    def merge(self, other):
+        """Merges another aggregate (e.g. computed in a worker process) into this one."""
+        for name, stats in other.totals.items():
+            self.totals.setdefault(name, RunningStats()).merge(stats)
+        for name, series in other.series.items():
+            for t, stats in series.items():
+                self.series[name][t].merge(stats)
+        if other.aoi_histogram is not None:
+            self._merge_histogram(other.aoi_histogram)
+
+    def to_dict(self):
+        """JSON-serialisable form (floats round-trip exactly through json)."""
+        return {
+            "totals": {name: stats.to_list() for name, stats in self.totals.items()},
+            "series": {
+                name: {str(t): stats.to_list() for t, stats in series.items()}
+                for name, series in self.series.items()
+            },
+            "aoi_histogram": None if self.aoi_histogram is None else self.aoi_histogram.counts.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregate = cls()
+        for name, values in data["totals"].items():
+            aggregate.totals[name] = RunningStats.from_list(values)
+        for name, series in data["series"].items():
+            for t, values in series.items():
+                aggregate.series[name][int(t)] = RunningStats.from_list(values)
+        if data.get("aoi_histogram") is not None:
+            aggregate.aoi_histogram = AoIHistogram(data["aoi_histogram"])
+        return aggregate
+
+    def _merge_histogram(self, counts):
+        if self.aoi_histogram is None:
+            self.aoi_histogram = AoIHistogram()
+        self.aoi_histogram.merge(counts)
+
+    def to_entries(self):
+        """The (vs_users, vs_time, vs_time_requests) entries of experiment_results."""
+        # Data for "vs Users" plot (Sensor Access, Energy, AoI, plus any optional totals)
+        vs_users = {}
+        for name, stats in self.totals.items():
+            if stats.count:
+                vs_users[f"avg_{name}"] = stats.mean
+                vs_users[f"std_{name}"] = stats.std
+        if self.aoi_histogram is not None:
+            for q in AOI_PERCENTILES:
+                vs_users[f"p{q}_aoi_for_qos"] = self.aoi_histogram.percentile(q)
+
+        # Data for "vs Time" plot (Sensor Access, Energy)
+        accesses, energy = self.series["accesses"], self.series["energy"]
+        sorted_time_steps = sorted(accesses.keys())
+        vs_time = {
+            "time_steps": sorted_time_steps,
+            "avg_sensor_accesses_over_time": [accesses[t].mean for t in sorted_time_steps],
+            "avg_energy_over_time": [energy[t].mean if t in energy else math.nan for t in sorted_time_steps]
+        }
+
+        # Data for "Requests vs Time" plot
+        requests = self.series["requests"]
+        sorted_req_time_steps = sorted(requests.keys())
+        vs_time_requests = {
+            "time_steps": sorted_req_time_steps,
+            "avg_requests_over_time": [requests[t].mean for t in sorted_req_time_steps]
+        }
+        return vs_users, vs_time, vs_time_requests
@@ -0,0 +1,291 @@
+# File: sem7/src/simulation/cache_store.py
+
+import numpy as np
+from collections import OrderedDict, defaultdict
+
+# ==============================================================================
+# DENSE ARRAY-BACKED CACHE STATE FOR THE ONLINE PHASE
+# ==============================================================================
+"""
+The online loop used to keep its cache as a dict keyed by (sensor_id, param_name)
+and look the policy up through param_classifications and master_policies for
+every parameter of every DQ. Here parameters are interned to integer indices once,
+the cache is a sensors x params AoI matrix, and all policies are stacked into a
+categories x max_aoi action table, so a decision is plain array indexing.
+
+Two AoI models are supported:
+
+- "lookup" (the original): the stored AoI is set to 1 on a fetch and grows by one
+  every time the entry is served from the cache, whatever the elapsed time.
+- "time": the store keeps the time step of the last fetch, and the AoI seen at
+  step t is max(t - fetched_at, 1), capped at max_aoi. An entry fetched at step t
+  and read once per step afterwards sees AoI 1, 2, 3, ... exactly as in the lookup
+  model; the floor of 1 keeps same-step reads inside the policy's 1..max_aoi state
+  space. Nothing is swept per step; the age is computed when an entry is read.
+"""
+NEVER_SEEN = 0  # AoI value stored for (sensor, param) pairs that were never fetched
+NEVER_FETCHED = -1  # fetch time stored for never-fetched pairs in the "time" model
+ACTION_CACHE, ACTION_FETCH = 0, 1
+AOI_MODELS = ("lookup", "time")
+
+class AoICacheStore:
+    """
+    Cache state of every (sensor, param) pair in a dense integer matrix.
+
+    aoi_model="lookup" keeps the AoI itself in `aoi` (NEVER_SEEN marks empty slots);
+    aoi_model="time" keeps the last fetch time step in `fetched_at` (NEVER_FETCHED if empty).
+    """
+
+    def __init__(self, num_sensors, num_params, aoi_model="lookup"):
+        if aoi_model not in AOI_MODELS:
+            raise ValueError(f"Unknown aoi_model: {aoi_model!r}")
+        self.aoi_model = aoi_model
+        self.aoi = None
+        self.fetched_at = None
+        if aoi_model == "lookup":
+            self.aoi = np.full((num_sensors, num_params), NEVER_SEEN, dtype=np.int32)
+        else:
+            self.fetched_at = np.full((num_sensors, num_params), NEVER_FETCHED, dtype=np.int32)
+
+    def __len__(self):
+        """Number of (sensor, param) pairs currently held in the cache."""
+        if self.aoi is not None:
+            return int(np.count_nonzero(self.aoi != NEVER_SEEN))
+        return int(np.count_nonzero(self.fetched_at != NEVER_FETCHED))
+
+    def get(self, sensor_id, param_idx):
+        """Stored value of a pair: its AoI ("lookup") or its last fetch time step ("time")."""
+        if self.aoi is not None:
+            return int(self.aoi[sensor_id, param_idx])
+        return int(self.fetched_at[sensor_id, param_idx])
+
+    def set(self, sensor_id, param_idx, value):
+        if self.aoi is not None:
+            self.aoi[sensor_id, param_idx] = value
+        else:
+            self.fetched_at[sensor_id, param_idx] = value
+
+    def clear(self, sensor_id, param_idx):
+        """Empties one slot (used for eviction)."""
+        self.set(sensor_id, param_idx, NEVER_SEEN if self.aoi is not None else NEVER_FETCHED)
+
+def policy_threshold(policy):
+    """
+    Returns the AoI from which a policy fetches (len(policy) + 1 if it never does), or None if
+    the policy is not of the "cache below k, fetch from k on" form.
+    """
+    policy = np.asarray(policy)
+    fetch_states = np.flatnonzero(policy == ACTION_FETCH)
+    threshold = int(fetch_states[0]) + 1 if len(fetch_states) else len(policy) + 1
+    if np.any(policy[threshold - 1:] != ACTION_FETCH) or np.any(policy[:threshold - 1] == ACTION_FETCH):
+        return None
+    return threshold
+
+class PolicyTable:
+    """
+    Stacked caching policies.
+
+    param_names     -- interned parameter names; param_index maps a name to its column
+    param_category  -- row of `actions` used for each parameter index
+    actions         -- (categories + 1) x max_aoi array; actions[c, aoi - 1] is the action
+                       at that AoI. The last row always fetches and is used for parameters
+                       whose category has no policy.
+    thresholds      -- per row, the AoI from which it fetches (max_aoi + 1 = never), or None
+                       if some row is not threshold-shaped. When set, a decision is just
+                       `aoi >= thresholds[row]`.
+    """
+
+    def __init__(self, param_names, categories, param_category, actions):
+        self.param_names = list(param_names)
+        self.param_index = {param: idx for idx, param in enumerate(self.param_names)}
+        self.categories = list(categories)
+        self.param_category = param_category
+        self.actions = actions
+
+        row_thresholds = [policy_threshold(row) for row in actions]
+        if any(threshold is None for threshold in row_thresholds):
+            self.thresholds = None
+        else:
+            self.thresholds = np.array(row_thresholds, dtype=np.int32)
+
+    @property
+    def param_thresholds(self):
+        """Threshold of every parameter index (None if the table is not threshold-shaped)."""
+        if self.thresholds is None:
+            return None
+        return self.thresholds[self.param_category]
+
+    @property
+    def max_aoi(self):
+        return self.actions.shape[1]
+
+    def action(self, param_idx, aoi):
+        """Action (ACTION_CACHE / ACTION_FETCH) for a cached entry of the given parameter and AoI."""
+        if self.thresholds is not None:
+            return ACTION_FETCH if aoi >= self.thresholds[self.param_category[param_idx]] else ACTION_CACHE
+        return int(self.actions[self.param_category[param_idx], aoi - 1])
+
+def compile_policy_table(master_policies, param_classifications, param_names, max_aoi):
+    """
+    Builds a PolicyTable from the brain returned by get_or_generate_brain.
+
+    A policy shorter than max_aoi is padded with its last action, matching the
+    `min(aoi - 1, len(policy) - 1)` clamping of the original dict-based lookup.
+    """
+    categories = [tuple(category) for category in master_policies]
+    category_row = {category: row for row, category in enumerate(categories)}
+    fetch_row = len(categories)
+
+    actions = np.full((len(categories) + 1, max_aoi), ACTION_FETCH, dtype=np.int8)
+    for row, category in enumerate(categories):
+        policy = np.asarray(master_policies[category])
+        clamped = np.minimum(np.arange(max_aoi), len(policy) - 1)
+        actions[row] = policy[clamped]
+
+    param_category = np.full(len(param_names), fetch_row, dtype=np.int32)
+    for idx, param in enumerate(param_names):
+        category = param_classifications.get(param)
+        if category is not None and tuple(category) in category_row:
+            param_category[idx] = category_row[tuple(category)]
+
+    return PolicyTable(param_names, categories, param_category, actions)
+
+# ==============================================================================
+# BOUNDED-CAPACITY CACHE WITH PLUGGABLE EVICTION
+# ==============================================================================
+"""
+Edge nodes only have room for a fixed number of (sensor, param) entries. The
+bounded store keeps the same AoI matrix but admits at most `capacity` entries;
+when a new entry is fetched into a full cache, the eviction policy names a
+victim, which goes back to the empty state. Keys are flat ints (sensor * params + param).
+All policies are O(1) per operation.
+"""
+class LRUEviction:
+    """Evicts the least recently used entry (lookups and fetches both count as use)."""
+
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def insert(self, key):
+        self.order[key] = None
+
+    def access(self, key):
+        self.order.move_to_end(key)
+
+    def fetch(self, key):
+        self.order.move_to_end(key)
+
+    def evict(self):
+        return self.order.popitem(last=False)[0]
+
+class LFUEviction:
+    """Evicts the least frequently used entry (oldest first among equal frequencies)."""
+
+    def __init__(self):
+        self.freq = {}
+        self.buckets = defaultdict(OrderedDict)  # frequency -> keys in insertion order
+        self.min_freq = 0
+
+    def insert(self, key):
+        self.freq[key] = 1
+        self.buckets[1][key] = None
+        self.min_freq = 1
+
+    def access(self, key):
+        freq = self.freq[key]
+        bucket = self.buckets[freq]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[freq]
+            if self.min_freq == freq:
+                self.min_freq = freq + 1
+        self.freq[key] = freq + 1
+        self.buckets[freq + 1][key] = None
+
+    fetch = access
+
+    def evict(self):
+        bucket = self.buckets[self.min_freq]
+        key, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self.buckets[self.min_freq]
+        del self.freq[key]
+        return key
+
+class AoIAwareEviction:
+    """
+    Evicts the least critical entries first and, within a criticality level, the stalest one
+    (the entry fetched longest ago). key_priority(key) gives the level; lower is evicted first.
+    """
+
+    def __init__(self, key_priority, num_levels):
+        self.key_priority = key_priority
+        self.levels = [OrderedDict() for _ in range(num_levels)]  # keys in fetch order per level
+
+    def insert(self, key):
+        self.levels[self.key_priority(key)][key] = None
+
+    def access(self, key):
+        pass  # a cache hit does not make the data any fresher
+
+    def fetch(self, key):
+        self.levels[self.key_priority(key)].move_to_end(key)
+
+    def evict(self):
+        for level in self.levels:
+            if level:
+                return level.popitem(last=False)[0]
+        raise KeyError("evict from an empty cache")
+
+EVICTION_POLICIES = ("lru", "lfu", "aoi")
+
+class BoundedAoICacheStore(AoICacheStore):
+    """AoICacheStore that holds at most `capacity` entries and counts evictions."""
+
+    def __init__(self, num_sensors, num_params, capacity, eviction, aoi_model="lookup"):
+        super().__init__(num_sensors, num_params, aoi_model)
+        if capacity < 1:
+            raise ValueError("cache capacity must be at least 1")
+        self.capacity = capacity
+        self.eviction = eviction
+        self.num_params = num_params
+        self.size = 0
+        self.evictions = 0
+
+    def on_lookup(self, sensor_id, param_idx, fetched, was_cached):
+        """
+        Updates the eviction bookkeeping for one decision; call it before writing the new AoI.
+        A fetch of an entry that is not cached yet admits it, evicting a victim if full.
+        """
+        key = sensor_id * self.num_params + param_idx
+        if was_cached:
+            if fetched:
+                self.eviction.fetch(key)
+            else:
+                self.eviction.access(key)
+            return
+        if self.size >= self.capacity:
+            victim = self.eviction.evict()
+            self.clear(victim // self.num_params, victim % self.num_params)
+            self.evictions += 1
+        else:
+            self.size += 1
+        self.eviction.insert(key)
+
+def make_bounded_store(num_sensors, num_params, capacity, eviction="lru", param_priority=None, aoi_model="lookup"):
+    """
+    Builds a BoundedAoICacheStore with the named eviction policy ("lru", "lfu" or "aoi").
+    "aoi" needs param_priority: an eviction level per parameter index (lower = evicted first).
+    """
+    if eviction == "lru":
+        policy = LRUEviction()
+    elif eviction == "lfu":
+        policy = LFUEviction()
+    elif eviction == "aoi":
+        if param_priority is None:
+            raise ValueError("AoI-aware eviction needs a priority per parameter")
+        priorities = list(param_priority)
+        policy = AoIAwareEviction(lambda key: priorities[key % num_params], max(priorities) + 1)
+    else:
+        raise ValueError(f"Unknown eviction policy: {eviction!r} (expected one of {EVICTION_POLICIES})")
+    return BoundedAoICacheStore(num_sensors, num_params, capacity, policy, aoi_model)
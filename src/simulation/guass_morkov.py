@@ -1,6 +1,10 @@
 import numpy as np
 import math
-import random
+
+from .trace import RequestTrace
+from .rng import ensure_rng
+from .recipes import DEFAULT_NUM_DQS
+from .instrumentation import ensure_profiler
 
 # ==============================================================================
 # HELPER & MOBILITY FUNCTIONS
@@ -10,18 +14,19 @@ The main thing is it will give us the requests in requred format and
 the funciton which helps us to get the location of nearest location of static sensor
 which will be used in db
 """
-def gauss_markov_mobility_step(user, mean_speed, alpha, bounds):
+def gauss_markov_mobility_step(user, mean_speed, alpha, bounds, rng=None):
     """Calculates the next step for a single user using the Gauss-Markov model and returns the updated user dictionary."""
+    rng = ensure_rng(rng)
     min_x, max_x, min_y, max_y = bounds
     x_pos, y_pos, speed, direction_rad, mean_direction_deg = \
         user['x'], user['y'], user['speed'], user['direction'], user['mean_direction']
 
     # Update speed and direction
     speed = (alpha * speed) + ((1 - alpha) * mean_speed) + \
-            (math.sqrt(1 - alpha**2) * np.random.normal(0, 1))
+            (math.sqrt(1 - alpha**2) * rng.normal(0, 1))
     direction_rad = (alpha * direction_rad) + \
                     ((1 - alpha) * math.radians(mean_direction_deg)) + \
-                    (math.sqrt(1 - alpha**2) * np.random.normal(0, 1))
+                    (math.sqrt(1 - alpha**2) * rng.normal(0, 1))
 
     # Update position
     x_pos += speed * math.cos(direction_rad)
@@ -40,8 +45,16 @@ def gauss_markov_mobility_step(user, mean_speed, alpha, bounds):
     })
     return user
 
-def find_nearest_sensor(coords, static_sensors):
-    """Finds the nearest static sensor to a given coordinate. Returns the sensor's ID and distance."""
+def find_nearest_sensor(coords, static_sensors, sensor_index=None):
+    """
+    Finds the nearest static sensor to a given coordinate. Returns the sensor's ID and distance.
+
+    If a SensorIndex (see sensor_index.py) built for static_sensors is passed, the lookup
+    uses it instead of scanning every sensor.
+    """
+    if sensor_index is not None:
+        return sensor_index.nearest(coords)
+
     min_dist = float('inf')
     nearest_sensor_id = -1
     
@@ -53,20 +66,171 @@ def find_nearest_sensor(coords, static_sensors):
             
     return nearest_sensor_id, min_dist
 
-def generate_user_requests(users, time_step):
+# ==============================================================================
+# VECTORIZED (STRUCT-OF-ARRAYS) MOBILITY ENGINE
+# ==============================================================================
+"""
+Same Gauss-Markov model as above, but the whole population is kept in NumPy
+arrays (one array per field) so a time step is a handful of array operations
+instead of one Python call and two scalar RNG draws per user.
+"""
+def init_user_arrays(num_users, area, mean_speed, rng=None):
+    """Creates the initial state of all users as a dictionary of NumPy arrays (one entry per field)."""
+    rng = ensure_rng(rng)
+    return {
+        'x': rng.uniform(area[0], area[1], num_users),
+        'y': rng.uniform(area[2], area[3], num_users),
+        'speed': rng.uniform(mean_speed * 0.8, mean_speed * 1.2, num_users),
+        'direction': np.radians(rng.uniform(0, 360, num_users)),
+        'mean_direction': rng.uniform(0, 360, num_users),
+        'request_interval': rng.integers(4, 10, num_users),  # 4..9 inclusive
+        'next_request_time': rng.uniform(0, 10, num_users)
+    }
+
+def gauss_markov_mobility_step_vectorized(users, mean_speed, alpha, bounds, rng=None):
+    """Advances every user by one Gauss-Markov step in place. `users` is the dict returned by init_user_arrays."""
+    rng = ensure_rng(rng)
+    min_x, max_x, min_y, max_y = bounds
+    num_users = len(users['x'])
+
+    # One batch of noise per step: column 0 drives speed, column 1 drives direction
+    noise = rng.normal(0, 1, (num_users, 2))
+    noise_scale = math.sqrt(1 - alpha**2)
+
+    speed = (alpha * users['speed']) + ((1 - alpha) * mean_speed) + (noise_scale * noise[:, 0])
+    direction_rad = (alpha * users['direction']) + \
+                    ((1 - alpha) * np.radians(users['mean_direction'])) + \
+                    (noise_scale * noise[:, 1])
+
+    x_pos = users['x'] + speed * np.cos(direction_rad)
+    y_pos = users['y'] + speed * np.sin(direction_rad)
+    mean_direction_deg = users['mean_direction']
+
+    # Boundary handling with masks (y is applied after x, as in the scalar version)
+    over_x, under_x = x_pos > max_x, x_pos < min_x
+    mean_direction_deg[over_x] = 180.0; x_pos[over_x] = max_x
+    mean_direction_deg[under_x] = 0.0; x_pos[under_x] = min_x
+    over_y, under_y = y_pos > max_y, y_pos < min_y
+    mean_direction_deg[over_y] = 270.0; y_pos[over_y] = max_y
+    mean_direction_deg[under_y] = 90.0; y_pos[under_y] = min_y
+
+    users.update({'x': x_pos, 'y': y_pos, 'speed': speed, 'direction': direction_rad})
+    return users
+
+def _catalog_dqs(catalog):
+    """
+    (number of DQs, most distinct DQs one request can draw, DQ popularity weights or None) for a
+    recipes.RecipeCatalog (None = built-in). DQs with zero weight are never drawn.
+    """
+    if catalog is None:
+        return DEFAULT_NUM_DQS, DEFAULT_NUM_DQS, None
+    if catalog.dq_weights is None:
+        return catalog.num_dqs, catalog.num_dqs, None
+    return catalog.num_dqs, int(np.count_nonzero(catalog.dq_weights)), catalog.dq_weights
+
+def _draw_due_requests(users, time_step, rng, catalog=None):
+    """
+    Selects the users due to make a request at this time step (with a mask) and draws their
+    DQ counts, DQ lists and request IDs in batches. Returns None if nobody is due, otherwise
+    (due_user_indices, request_ids, dq_counts, dq_values) where dq_values holds the sorted
+    DQ lists of all due users back to back.
+    """
+    due = np.flatnonzero(time_step >= users['next_request_time'])
+    if len(due) == 0:
+        return None
+
+    total_dqs, max_dqs, dq_weights = _catalog_dqs(catalog)
+    num_dqs = np.minimum(rng.integers(1, 6, len(due)), max_dqs)
+    if dq_weights is None:
+        # A random key per DQ; the num_dqs smallest keys are the sample
+        keys = rng.random((len(due), total_dqs))
+    else:
+        # Weighted sampling without replacement: the num_dqs smallest keys -log(u) / weight
+        with np.errstate(divide='ignore'):
+            keys = -np.log(rng.random((len(due), total_dqs))) / dq_weights
+    request_ids = rng.integers(1000, 10000, len(due))
+
+    # Only the k smallest keys per request matter: select them, then order just those k
+    k = int(num_dqs.max())
+    if k < total_dqs:
+        # Zero-weight DQs have an infinite key and k never exceeds the positive-weight DQs
+        candidates = np.argpartition(keys, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(total_dqs), keys.shape)
+    order = np.lexsort((candidates, np.take_along_axis(keys, candidates, axis=1)))
+    dq_perms = np.take_along_axis(candidates, order, axis=1) + 1
+
+    # Keep only the sampled DQs, sorted within each request (unsampled slots sort to the end)
+    selected = np.arange(k) < num_dqs[:, None]
+    dq_values = np.sort(np.where(selected, dq_perms, total_dqs + 1), axis=1)[selected]
+
+    # Set the next request time for the users that just made a request
+    users['next_request_time'][due] += users['request_interval'][due]
+    return due, request_ids, num_dqs, dq_values
+
+def generate_user_requests_vectorized(users, user_ids, time_step, rng=None, catalog=None):
+    """
+    Array version of generate_user_requests. Returns requests in the same
+    [user_id, user_x, user_y, request_id, time_step, dq_list] format.
+    """
+    drawn = _draw_due_requests(users, time_step, ensure_rng(rng), catalog)
+    if drawn is None:
+        return []
+    due, request_ids, num_dqs, dq_values = drawn
+    xs = np.round(users['x'][due], 2).tolist()
+    ys = np.round(users['y'][due], 2).tolist()
+    dq_values = dq_values.tolist()
+    bounds = np.concatenate([[0], np.cumsum(num_dqs)]).tolist()
+
+    return [
+        [user_ids[u], xs[k], ys[k], int(request_ids[k]), time_step, dq_values[bounds[k]:bounds[k + 1]]]
+        for k, u in enumerate(due.tolist())
+    ]
+
+def generate_user_requests_columnar(users, time_step, rng=None, catalog=None):
+    """
+    Same as generate_user_requests_vectorized but returns the step's requests as a
+    RequestTrace (integer user IDs, CSR-style DQ lists) without building any Python lists.
+    """
+    drawn = _draw_due_requests(users, time_step, ensure_rng(rng), catalog)
+    if drawn is None:
+        return RequestTrace.empty()
+    due, request_ids, num_dqs, dq_values = drawn
+    dq_offsets = np.zeros(len(due) + 1, dtype=np.int64)
+    np.cumsum(num_dqs, out=dq_offsets[1:])
+    return RequestTrace(
+        user_id=(due + 1).astype(np.int32),
+        x=np.round(users['x'][due], 2),
+        y=np.round(users['y'][due], 2),
+        request_id=request_ids.astype(np.int32),
+        time_step=np.full(len(due), time_step, dtype=np.int32),
+        dq_offsets=dq_offsets,
+        dq_values=dq_values.astype(np.int16)
+    )
+
+def users_from_arrays(users, user_ids):
+    """Converts the struct-of-arrays user state back into the list-of-dicts format."""
+    fields = list(users.keys())
+    columns = [users[f].tolist() for f in fields]
+    return [dict(id=user_id, **dict(zip(fields, row))) for user_id, row in zip(user_ids, zip(*columns))]
+
+def generate_user_requests(users, time_step, rng=None, catalog=None):
     """
     Checks which users should make a request at the current time step and returns a list of request data.
     
-    Modified to include a random unique request/destination ID.
+    Modified to include a random unique request/destination ID. DQs are drawn from the
+    recipes.RecipeCatalog `catalog` (None = the built-in 25 DQs, uniformly).
     """
+    rng = ensure_rng(rng)
+    total_dqs, max_dqs, dq_weights = _catalog_dqs(catalog)
     requests_this_step = []
     for user in users:
         if time_step >= user['next_request_time']:
-            num_dqs = random.randint(1, 5)
-            dq_list = sorted(random.sample(range(1, 26), num_dqs)) # DQs from 1 to 25
+            num_dqs = min(int(rng.integers(1, 6)), max_dqs)
+            dq_list = sorted((rng.choice(total_dqs, num_dqs, replace=False, p=dq_weights) + 1).tolist()) # DQs from 1 to total_dqs
             
             # Generate a random ID (e.g., representing a destination or request ID)
-            request_id = random.randint(1000, 9999) 
+            request_id = int(rng.integers(1000, 10000))
             
             # Request format: [user_id, user_x, user_y, request_id, time_step, dq_list]
             requests_this_step.append([
@@ -85,43 +249,92 @@ def generate_user_requests(users, time_step):
 # NEW: MAIN SIMULATION WRAPPER FUNCTION
 # ==============================================================================
 
-def run_simulation(num_users, num_sensors, area, duration, mean_speed, alpha):
+def _check_simulation_options(mobility_engine, trace_format):
+    if mobility_engine not in ("vectorized", "scalar"):
+        raise ValueError(f"Unknown mobility_engine: {mobility_engine!r}")
+    if trace_format not in ("list", "columnar"):
+        raise ValueError(f"Unknown trace_format: {trace_format!r}")
+
+def _place_static_sensors(num_sensors, area, rng):
+    return {
+        'x': rng.uniform(area[0], area[1], num_sensors).tolist(),
+        'y': rng.uniform(area[2], area[3], num_sensors).tolist()
+    }
+
+def _simulate_request_steps(num_users, area, duration, mean_speed, alpha, mobility_engine, columnar, final_user_state,
+                            rng, profiler=None, catalog=None):
+    """
+    Generator behind run_simulation and stream_simulation: moves the users and yields the
+    requests of each time step (a list, or a RequestTrace if columnar). Once all steps are
+    done the final user dicts are appended to final_user_state.
+    """
+    profiler = ensure_profiler(profiler)
+    user_ids = [f"user_{i+1}" for i in range(num_users)]
+    user_arrays = init_user_arrays(num_users, area, mean_speed, rng)
+    if mobility_engine == "scalar":
+        end_users = users_from_arrays(user_arrays, user_ids)
+
+    for t in range(duration):
+        if mobility_engine == "vectorized":
+            with profiler.timer("simulation.mobility"):
+                gauss_markov_mobility_step_vectorized(user_arrays, mean_speed, alpha, area, rng)
+            with profiler.timer("simulation.request_generation"):
+                if columnar:
+                    requests_this_step = generate_user_requests_columnar(user_arrays, t, rng, catalog)
+                else:
+                    requests_this_step = generate_user_requests_vectorized(user_arrays, user_ids, t, rng, catalog)
+        else:
+            # Update positions of all users
+            with profiler.timer("simulation.mobility"):
+                for i in range(len(end_users)):
+                    end_users[i] = gauss_markov_mobility_step(end_users[i], mean_speed, alpha, area, rng)
+            # Generate DQ requests for this time step
+            with profiler.timer("simulation.request_generation"):
+                requests_this_step = generate_user_requests(end_users, t, rng, catalog)
+                if columnar:
+                    requests_this_step = RequestTrace.from_requests(requests_this_step)
+        profiler.count("simulation.requests", len(requests_this_step))
+        yield requests_this_step
+
+    if mobility_engine == "vectorized":
+        end_users = users_from_arrays(user_arrays, user_ids)
+    final_user_state.extend(end_users)
+
+def run_simulation(num_users, num_sensors, area, duration, mean_speed, alpha, mobility_engine="vectorized",
+                   trace_format="list", rng=None, profiler=None, catalog=None):
     """
     Runs the entire mobility and request generation simulation for a single iteration.
     Returns the collected requests and the final state of all nodes.
+
+    mobility_engine selects "vectorized" (struct-of-arrays, default) or "scalar"
+    (one dict per user, the original implementation). Both produce the same request format.
+    trace_format="columnar" returns the requests as a RequestTrace instead of a list of lists.
+
+    All randomness is drawn from `rng` (a np.random.Generator or an int seed; None = fresh
+    entropy), so the same seed always yields the same events.
+    profiler (instrumentation.Profiler) times mobility stepping and request generation.
+    catalog (recipes.RecipeCatalog) sets the DQ numbers and their popularity; None draws the
+    built-in 25 DQs uniformly.
     """
+    _check_simulation_options(mobility_engine, trace_format)
+    columnar = trace_format == "columnar"
+    rng = ensure_rng(rng)
+
     # --- 1. Initialization ---
-    static_sensors = {
-        'x': [random.uniform(area[0], area[1]) for _ in range(num_sensors)],
-        'y': [random.uniform(area[2], area[3]) for _ in range(num_sensors)]
-    }
-    
+    static_sensors = _place_static_sensors(num_sensors, area, rng)
     end_users = []
-    for i in range(num_users):
-        end_users.append({
-            'id': f"user_{i+1}",
-            'x': random.uniform(area[0], area[1]),
-            'y': random.uniform(area[2], area[3]),
-            'speed': random.uniform(mean_speed * 0.8, mean_speed * 1.2),
-            'direction': math.radians(random.uniform(0, 360)),
-            'mean_direction': random.uniform(0, 360),
-            'request_interval': random.randint(4, 9),
-            'next_request_time': random.uniform(0, 10)
-        })
-
-    all_generated_requests = []
 
     # --- 2. Main Simulation Loop ---
-    for t in range(duration):
-        # Update positions of all users
-        for i in range(len(end_users)):
-            end_users[i] = gauss_markov_mobility_step(end_users[i], mean_speed, alpha, area)
-
-        # Generate DQ requests for this time step
-        requests_this_step = generate_user_requests(end_users, t)
-        if requests_this_step:
+    steps = _simulate_request_steps(
+        num_users, area, duration, mean_speed, alpha, mobility_engine, columnar, end_users, rng, profiler, catalog
+    )
+    if columnar:
+        all_generated_requests = RequestTrace.concatenate(list(steps))
+    else:
+        all_generated_requests = []
+        for requests_this_step in steps:
             all_generated_requests.extend(requests_this_step)
-    
+
     # --- 3. Return Results ---
     return {
         "requests": all_generated_requests,
@@ -129,9 +342,53 @@ def run_simulation(num_users, num_sensors, area, duration, mean_speed, alpha):
         "final_user_state": end_users
     }
 
+def stream_simulation(num_users, num_sensors, area, duration, mean_speed, alpha, chunk_steps=1,
+                      mobility_engine="vectorized", trace_format="list", rng=None, profiler=None, catalog=None):
+    """
+    Streaming version of run_simulation. Instead of "requests" the returned dict holds
+    "request_chunks", a generator that advances the simulation lazily and yields the requests
+    of every `chunk_steps` time steps (a list, or a RequestTrace if columnar). Only one chunk
+    is alive at a time, so memory does not grow with `duration`.
+
+    run_single_online_iteration consumes this dict directly. "final_user_state" is filled in
+    once the generator has been exhausted. With the same `rng` seed the streamed requests are
+    identical to those of run_simulation. profiler and catalog are used as in run_simulation.
+    """
+    _check_simulation_options(mobility_engine, trace_format)
+    if chunk_steps < 1:
+        raise ValueError("chunk_steps must be at least 1")
+    columnar = trace_format == "columnar"
+    rng = ensure_rng(rng)
+
+    static_sensors = _place_static_sensors(num_sensors, area, rng)
+    end_users = []
+
+    def request_chunks():
+        steps = _simulate_request_steps(
+            num_users, area, duration, mean_speed, alpha, mobility_engine, columnar, end_users, rng, profiler,
+            catalog
+        )
+        chunk = []
+        for t, requests_this_step in enumerate(steps):
+            if columnar:
+                chunk.append(requests_this_step)
+            else:
+                chunk.extend(requests_this_step)
+            if (t + 1) % chunk_steps == 0 or t == duration - 1:
+                yield RequestTrace.concatenate(chunk) if columnar else chunk
+                chunk = []
+
+    return {
+        "request_chunks": request_chunks(),
+        "static_sensors": static_sensors,
+        "final_user_state": end_users
+    }
+
 # ==============================================================================
 # EXAMPLE OF HOW TO CALL THE SIMULATION
 # ==============================================================================
+# The module uses package-relative imports, so run the example from src/ as a module:
+#   python -m simulation.guass_morkov
 if __name__ == '__main__':
     # --- Define Simulation Parameters ---
     SIM_PARAMS = {
@@ -0,0 +1,82 @@
+# File: sem7/src/simulation/instrumentation.py
+
+import time
+import contextlib
+from collections import defaultdict
+
+# ==============================================================================
+# STAGE TIMERS AND COUNTERS FOR THE SIMULATION / OFFLINE HOT PATHS
+# ==============================================================================
+"""
+run_simulation, run_single_online_iteration, solve_mdp, get_or_generate_brain and
+the sweep take an optional `profiler`. A Profiler collects:
+
+- timers:   seconds per stage ("simulation.mobility", "online.nearest_sensor", ...).
+            Timers record self time: a stage nested in another is subtracted from
+            the outer one, so the timers of a record add up to the wall time covered.
+- counters: event counts ("online.lookups", "online.fetches[High/Low]", "mdp.sweeps", ...).
+
+profiler=None resolves to NULL_PROFILER, whose methods do nothing. The hot loops
+never call the profiler per lookup; per-parameter counts are only kept when the
+profiler is enabled and are turned into counters once per run.
+"""
+class Profiler:
+    """Collects per-stage timers and counters; to_dict() gives the exported profile record."""
+    enabled = True
+
+    def __init__(self):
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+        self._nested = []  # time spent in nested timers, per open timer
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timers[name] += elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def merge(self, other):
+        """Adds another profiler's (or profile record's) timers and counters to this one."""
+        if isinstance(other, dict):
+            timers, counters = other["timers"], other["counters"]
+        else:
+            timers, counters = other.timers, other.counters
+        for name, seconds in timers.items():
+            self.timers[name] += seconds
+        for name, value in counters.items():
+            self.counters[name] += value
+
+    def to_dict(self):
+        return {"timers": dict(self.timers), "counters": dict(self.counters)}
+
+class NullProfiler:
+    """Disabled profiler: same interface as Profiler, records nothing."""
+    enabled = False
+    _null_timer = contextlib.nullcontext()
+
+    def timer(self, name):
+        return self._null_timer
+
+    def count(self, name, value=1):
+        pass
+
+    def merge(self, other):
+        pass
+
+    def to_dict(self):
+        return {"timers": {}, "counters": {}}
+
+NULL_PROFILER = NullProfiler()
+
+def ensure_profiler(profiler):
+    """Returns `profiler`, or the no-op NULL_PROFILER for None."""
+    return NULL_PROFILER if profiler is None else profiler
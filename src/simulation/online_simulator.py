@@ -1,13 +1,15 @@
 # File: sem7/src/simulation/online_simulator.py
 
-import numpy as np
-import math
-import random
 from collections import defaultdict
 
 # --- Import project-specific functions ---
-from .guass_morkov import run_simulation, find_nearest_sensor 
-from .config import DECISION_RECIPES
+from .guass_morkov import run_simulation
+from .sensor_index import build_sensor_index
+from .cache_store import (AoICacheStore, NEVER_SEEN, NEVER_FETCHED, ACTION_FETCH, ACTION_CACHE, AOI_MODELS,
+                          compile_policy_table, make_bounded_store)
+from .replay_engine import iter_resolved_chunks, run_batched_replay, run_multi_policy_replay, count_category_decisions
+from .instrumentation import ensure_profiler
+from .recipes import DEFAULT_CATALOG
 
 # --- Simulation Cost & Time Parameters ---
 COST_SENSOR_FETCH_ENERGY = 10.0
@@ -17,28 +19,141 @@ TIME_CACHE_LOOKUP_MS = 5
 MAX_AOI = 100
 
 def get_params_for_dq(dq_number):
-    """Helper function to map a DQ number to its required parameters."""
-    recipe_key = list(DECISION_RECIPES.keys())[dq_number % len(DECISION_RECIPES)]
-    return DECISION_RECIPES[recipe_key]["parameters"]
+    """Helper function to map a DQ number to its required parameters (built-in recipe catalog)."""
+    return DEFAULT_CATALOG.params_for_dq(dq_number)
 
-def run_single_online_iteration(num_users, master_policies, param_classifications, simulation_events=None):
+# Every parameter used by any recipe, interned to an index (same ordering as the offline phase)
+ALL_PARAMETERS = DEFAULT_CATALOG.param_names
+PARAM_INDEX = DEFAULT_CATALOG.param_index
+
+# Eviction level of each criticality category for AoI-aware eviction (lower levels are evicted first)
+CRITICALITY_EVICTION_LEVEL = {'Low': 0, 'Medium': 1, 'High': 2}
+
+def get_param_eviction_levels(param_classifications, param_names=ALL_PARAMETERS):
+    """Eviction level per interned parameter; unclassified parameters are kept longest."""
+    return [
+        CRITICALITY_EVICTION_LEVEL[param_classifications[param][1]] if param in param_classifications
+        else max(CRITICALITY_EVICTION_LEVEL.values())
+        for param in param_names
+    ]
+
+def iter_resolved_requests(simulation_events, sensor_index, profiler=None):
+    """
+    Yields (time_step, nearest_sensor_id, dq_list) for every request in simulation_events, in order.
+
+    Accepts either a full "requests" collection (list of lists or RequestTrace) or the
+    "request_chunks" generator produced by stream_simulation. Each chunk's nearest sensors are
+    resolved with one batch query, and only one chunk is held in memory at a time.
+    """
+    for trace, nearest_sensor_ids in iter_resolved_chunks(simulation_events, sensor_index, profiler):
+        dq_offsets = trace.dq_offsets.tolist()
+        dq_values = trace.dq_values.tolist()
+        for i, (time_step, nearest_sensor_id) in enumerate(zip(trace.time_step.tolist(), nearest_sensor_ids.tolist())):
+            yield time_step, nearest_sensor_id, dq_values[dq_offsets[i]:dq_offsets[i + 1]]
+
+def run_single_online_iteration(num_users, master_policies, param_classifications, simulation_events=None,
+                                engine="scalar", rng=None, cache_capacity=None, eviction="lru",
+                                coalesce=False, aoi_histogram=False, aoi_model="lookup", catalog=None, profiler=None):
     """
     Runs ONE full online simulation iteration and returns the detailed performance metrics.
     
-    Modified to accept pre-generated simulation_events.
+    Modified to accept pre-generated simulation_events, either from run_simulation or
+    streamed from stream_simulation (requests are then consumed chunk by chunk), or as
+    "resolved_chunks" with precomputed nearest sensors (see iter_resolved_chunks).
+
+    engine selects "scalar" (one lookup at a time, below) or "batched" (replay_engine.py,
+    one time step at a time with NumPy). Both return identical results for the same trace.
+    rng seeds the fallback simulation when no simulation_events are passed.
+
+    cache_capacity bounds the number of (sensor, param) entries the edge cache holds
+    (None = unbounded); when full, `eviction` ("lru", "lfu" or "aoi") picks the entry to drop
+    and the result also reports "total_evictions". Bounded caches need the scalar engine.
+
+    coalesce=True models a single-flight gateway: within a time step only the first lookup of a
+    (sensor, param) key decides. Later lookups of that key are served from the same read (the fresh
+    value if it was fetched, else the AoI the first lookup saw), pay the cache lookup energy and do
+    not age the entry again. The result then also reports "total_fetch_demands" (lookups that
+    wanted a fetch, incl. the coalesced ones) and "total_coalesced_lookups".
+
+    aoi_histogram=True adds "aoi_histogram": the number of decisions made at each AoI
+    (index = AoI, 0..MAX_AOI), from which the sweep derives AoI percentiles.
+
+    aoi_model picks how cached entries age (cache_store.py): "lookup" (default) adds one per
+    cache hit, "time" stores the fetch time step and ages entries with elapsed time steps, so
+    the policy is indexed on real elapsed time. Energy/AoI metrics are reported the same way.
+
+    catalog (recipes.RecipeCatalog, default: the built-in DECISION_RECIPES catalog) maps DQ
+    numbers to parameter indices; it should be the catalog the trace was generated with.
+
+    profiler (instrumentation.Profiler) times nearest-sensor resolution and the decision loop
+    and counts lookups, hits and fetches per category.
     """
+    profiler = ensure_profiler(profiler)
+    if engine not in ("scalar", "batched"):
+        raise ValueError(f"Unknown engine: {engine!r}")
+    if aoi_model not in AOI_MODELS:
+        raise ValueError(f"Unknown aoi_model: {aoi_model!r}")
+    if cache_capacity is not None and engine != "scalar":
+        raise ValueError("A bounded cache_capacity is only supported by the scalar engine")
+    catalog = catalog or DEFAULT_CATALOG
+    param_names = catalog.param_names
+
     if simulation_events is None:
         # Fallback for testing, but main.py will pass this directly
         simulation_events = run_simulation(
             num_users=num_users, num_sensors=450, area=(0, 10000, 0, 10000),
-            duration=100, mean_speed=15, alpha=0.75
+            duration=100, mean_speed=15, alpha=0.75, rng=rng, catalog=catalog
         )
         
-    all_requests = simulation_events["requests"]
     static_sensors = simulation_events["static_sensors"]
 
+    # Nearest sensors are resolved in batch queries against the sensor index (unless already resolved)
+    if "resolved_chunks" in simulation_events:
+        sensor_index = None
+    else:
+        sensor_index = simulation_events.get("sensor_index") or build_sensor_index(static_sensors)
+
+    if engine == "batched":
+        policy_table = compile_policy_table(master_policies, param_classifications, param_names, MAX_AOI)
+        return run_batched_replay(
+            simulation_events, sensor_index, policy_table, catalog,
+            MAX_AOI, COST_SENSOR_FETCH_ENERGY, COST_CACHE_LOOKUP_ENERGY, coalesce=coalesce,
+            aoi_histogram=aoi_histogram, aoi_model=aoi_model, profiler=profiler
+        )
+
     # --- 2. Initialize State for this Run ---
-    db = {}  # The database: {(sensor_id, param_name): aoi}
+    # The database: a sensors x params AoI matrix (NEVER_SEEN for pairs never fetched), or with
+    # aoi_model="time" a matrix of last fetch time steps (NEVER_FETCHED for pairs never fetched)
+    if cache_capacity is None:
+        db = AoICacheStore(len(static_sensors['x']), len(param_names), aoi_model)
+        bounded_db = None
+    else:
+        # A bounded store also tracks recency/frequency for eviction; evicted pairs are emptied again
+        db = bounded_db = make_bounded_store(
+            len(static_sensors['x']), len(param_names), cache_capacity, eviction,
+            param_priority=get_param_eviction_levels(param_classifications, param_names) if eviction == "aoi" else None,
+            aoi_model=aoi_model
+        )
+    time_aoi = aoi_model == "time"
+    aoi_matrix = db.aoi
+    fetch_times = db.fetched_at
+    # All category policies stacked into one action table, indexed by [category, aoi - 1]
+    policy_table = compile_policy_table(master_policies, param_classifications, param_names, MAX_AOI)
+    param_actions = [policy_table.actions[c].tolist() for c in policy_table.param_category]
+    # Threshold-shaped policies (the usual case) reduce the decision to one integer comparison
+    param_thresholds = policy_table.param_thresholds
+    if param_thresholds is not None:
+        param_thresholds = param_thresholds.tolist()
+    dq_param_indices = {}  # DQ number -> interned parameter indices, filled on first use
+    num_params = len(param_names)
+    # Coalescing: key -> (AoI served, fetched?) decided by the first lookup of the key in this time step
+    step_reads = {}
+    step_reads_time = None
+    total_fetch_demands = 0
+    total_coalesced_lookups = 0
+    # Per-parameter decision counts, only kept when profiling
+    param_lookup_counts = [0] * num_params if profiler.enabled else None
+    param_fetch_counts = [0] * num_params if profiler.enabled else None
 
     # Performance metric counters
     total_sensor_accesses = 0
@@ -46,70 +161,153 @@ def run_single_online_iteration(num_users, master_policies, param_classification
     total_decisions_made = 0
     
     # NEW: Metrics for time-series and QoS
-    aoi_at_decision_time = []
+    # Running sum/count of the AoI at decision time (a list would grow with the simulation length)
+    aoi_sum_at_decision_time = 0
+    num_aoi_samples = 0
+    aoi_counts = [0] * (MAX_AOI + 1) if aoi_histogram else None
     accesses_over_time = defaultdict(int)
     energy_over_time = defaultdict(float)
     requests_over_time = defaultdict(int) # NEW: Track total requests per time step
 
     # --- 3. Process All Requests Chronologically ---
-    for request in all_requests:
-        # Request structure is now: [user_id, user_x, user_y, request_id, time_step, dq_list]
-        user_id, user_x, user_y, request_id, time_step, dq_list = request
-        
-        # Track number of unique requests per time step (for the "Requests vs Time" plot)
-        requests_over_time[time_step] += 1
+    with profiler.timer("online.policy_lookup"):
+        for time_step, nearest_sensor_id, dq_list in iter_resolved_requests(simulation_events, sensor_index, profiler):
+            # Track number of unique requests per time step (for the "Requests vs Time" plot)
+            requests_over_time[time_step] += 1
+            if coalesce and time_step != step_reads_time:
+                step_reads.clear()
+                step_reads_time = time_step
 
-        user_coords = (user_x, user_y)
-        nearest_sensor_id, _ = find_nearest_sensor(user_coords, static_sensors)
-        
-        for dq in dq_list:
-            total_decisions_made += 1
-            required_params = get_params_for_dq(dq)
+            for dq in dq_list:
+                total_decisions_made += 1
+                required_params = dq_param_indices.get(dq)
+                if required_params is None:
+                    required_params = dq_param_indices[dq] = catalog.param_list(dq)
             
-            for param in required_params:
-                db_key = (nearest_sensor_id, param)
-                
-                # Default to a high AoI if the parameter has never been seen
-                current_aoi = db.get(db_key, MAX_AOI)
+                for param_idx in required_params:
+                    if coalesce:
+                        key = nearest_sensor_id * num_params + param_idx
+                        shared_read = step_reads.get(key)
+                        if shared_read is not None:
+                            # Served from this step's read of the key: no second fetch, no extra ageing
+                            shared_aoi, shared_fetch = shared_read
+                            aoi_sum_at_decision_time += shared_aoi
+                            num_aoi_samples += 1
+                            if aoi_counts is not None:
+                                aoi_counts[shared_aoi] += 1
+                            if param_lookup_counts is not None:
+                                param_lookup_counts[param_idx] += 1
+                            total_energy_consumed += COST_CACHE_LOOKUP_ENERGY
+                            energy_over_time[time_step] += COST_CACHE_LOOKUP_ENERGY
+                            if shared_fetch:
+                                total_fetch_demands += 1
+                                total_coalesced_lookups += 1
+                            continue
+
+                    # Default to a high AoI if the parameter has never been seen
+                    if time_aoi:
+                        # Data fetched in this very time step still has AoI 1
+                        fetched_at = fetch_times.item(nearest_sensor_id, param_idx)
+                        never_seen = fetched_at == NEVER_FETCHED
+                        current_aoi = MAX_AOI if never_seen else min(max(time_step - fetched_at, 1), MAX_AOI)
+                    else:
+                        stored_aoi = aoi_matrix.item(nearest_sensor_id, param_idx)
+                        never_seen = stored_aoi == NEVER_SEEN
+                        current_aoi = MAX_AOI if never_seen else stored_aoi
                 
-                # RECORD THE AOI FOR QOS MEASUREMENT
-                aoi_at_decision_time.append(current_aoi)
-
-                # --- MDP Logic to decide action ---
-                if db_key not in db:
-                    action = 1
-                else:
-                    # Note: param_classifications uses a list from json load, must convert to tuple for dict lookup
-                    category = tuple(param_classifications.get(param)) 
-                    
-                    if category and category in master_policies:
-                        policy = master_policies[category]
-                        action_index = min(current_aoi - 1, len(policy) - 1)
-                        action = policy[action_index]
+                    # RECORD THE AOI FOR QOS MEASUREMENT
+                    aoi_sum_at_decision_time += current_aoi
+                    num_aoi_samples += 1
+                    if aoi_counts is not None:
+                        aoi_counts[current_aoi] += 1
+                    if param_lookup_counts is not None:
+                        param_lookup_counts[param_idx] += 1
+
+                    # --- MDP Logic to decide action (a never-seen pair is always fetched) ---
+                    if never_seen:
+                        action = ACTION_FETCH
+                    elif param_thresholds is not None:
+                        action = ACTION_FETCH if current_aoi >= param_thresholds[param_idx] else ACTION_CACHE
                     else:
-                        action = 1
-
-                if action == 1: # FETCH
-                    total_sensor_accesses += 1
-                    total_energy_consumed += COST_SENSOR_FETCH_ENERGY
-                    accesses_over_time[time_step] += 1
-                    energy_over_time[time_step] += COST_SENSOR_FETCH_ENERGY
-                    db[db_key] = 1
-                else: # CACHE
-                    total_energy_consumed += COST_CACHE_LOOKUP_ENERGY
-                    energy_over_time[time_step] += COST_CACHE_LOOKUP_ENERGY
-                    db[db_key] = min(current_aoi + 1, MAX_AOI)
+                        action = param_actions[param_idx][current_aoi - 1]
+
+                    if bounded_db is not None:
+                        bounded_db.on_lookup(nearest_sensor_id, param_idx, action == ACTION_FETCH,
+                                             not never_seen)
+                    if coalesce:
+                        step_reads[key] = (1, True) if action == ACTION_FETCH else (current_aoi, False)
+
+                    if action == ACTION_FETCH: # FETCH
+                        total_sensor_accesses += 1
+                        total_fetch_demands += 1
+                        if param_fetch_counts is not None:
+                            param_fetch_counts[param_idx] += 1
+                        total_energy_consumed += COST_SENSOR_FETCH_ENERGY
+                        accesses_over_time[time_step] += 1
+                        energy_over_time[time_step] += COST_SENSOR_FETCH_ENERGY
+                        if time_aoi:
+                            fetch_times[nearest_sensor_id, param_idx] = time_step
+                        else:
+                            aoi_matrix[nearest_sensor_id, param_idx] = 1
+                    else: # CACHE
+                        total_energy_consumed += COST_CACHE_LOOKUP_ENERGY
+                        energy_over_time[time_step] += COST_CACHE_LOOKUP_ENERGY
+                        if not time_aoi:
+                            # Time-driven entries age with the clock, not with hits
+                            aoi_matrix[nearest_sensor_id, param_idx] = min(current_aoi + 1, MAX_AOI)
+
+    profiler.count("online.requests", sum(requests_over_time.values()))
+    if param_lookup_counts is not None:
+        count_category_decisions(profiler, policy_table, param_lookup_counts, param_fetch_counts)
 
     # --- Calculate the final QoS metric ---
-    avg_aoi = np.mean(aoi_at_decision_time) if aoi_at_decision_time else 0
+    avg_aoi = aoi_sum_at_decision_time / num_aoi_samples if num_aoi_samples else 0
     # avg_energy_per_decision calculation is generally kept for internal reference, 
     # but the plots require total_energy_consumed
     
-    return {
+    results = {
         "avg_aoi_for_qos": avg_aoi, 
         "total_sensor_accesses": total_sensor_accesses,
         "total_energy_consumed": total_energy_consumed,
         "requests_over_time": requests_over_time, # NEW RETURN VALUE
         "accesses_over_time": accesses_over_time,
         "energy_over_time": energy_over_time
-    }
\ No newline at end of file
+    }
+    if bounded_db is not None:
+        results["total_evictions"] = bounded_db.evictions
+    if coalesce:
+        results["total_fetch_demands"] = total_fetch_demands
+        results["total_coalesced_lookups"] = total_coalesced_lookups
+    if aoi_counts is not None:
+        results["aoi_histogram"] = aoi_counts
+    return results
+
+def run_policy_comparison(num_users, policies, param_classifications, simulation_events=None, rng=None,
+                          coalesce=False, aoi_histogram=False, aoi_model="lookup", catalog=None, profiler=None):
+    """
+    Replays ONE trace against several caching schemes (policies.CachingPolicy instances) in a
+    single pass with the batched engine and returns {policy.name: metrics dict}.
+
+    Mobility, nearest-sensor resolution and DQ expansion happen once; each scheme keeps its own
+    cache, so the results match separate run_single_online_iteration runs over the same trace.
+    profiler only records stage timers here (decision counters are per single-policy run).
+    catalog is as in run_single_online_iteration.
+    """
+    catalog = catalog or DEFAULT_CATALOG
+    if simulation_events is None:
+        simulation_events = run_simulation(
+            num_users=num_users, num_sensors=450, area=(0, 10000, 0, 10000),
+            duration=100, mean_speed=15, alpha=0.75, rng=rng, catalog=catalog
+        )
+    names = [policy.name for policy in policies]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Policy names must be unique: {names}")
+
+    sensor_index = simulation_events.get("sensor_index") or build_sensor_index(simulation_events["static_sensors"])
+    policy_tables = [policy.compile(param_classifications, catalog.param_names, MAX_AOI) for policy in policies]
+    results = run_multi_policy_replay(
+        simulation_events, sensor_index, policy_tables, catalog,
+        MAX_AOI, COST_SENSOR_FETCH_ENERGY, COST_CACHE_LOOKUP_ENERGY, coalesce=coalesce,
+        aoi_histogram=aoi_histogram, aoi_model=aoi_model, profiler=profiler
+    )
+    return dict(zip(names, results))
@@ -0,0 +1,60 @@
+# File: sem7/src/simulation/policies.py
+
+import numpy as np
+
+from .cache_store import PolicyTable, ACTION_CACHE, ACTION_FETCH, compile_policy_table
+
+# ==============================================================================
+# CACHING SCHEMES COMPARED IN THE ONLINE PHASE
+# ==============================================================================
+"""
+Every scheme is expressed as a cache_store.PolicyTable, so the replay engines can
+run any of them without special cases. The A2C-Safe scheme is the MDP brain; the
+baselines are a static TTL (serve from cache until the entry reaches a fixed
+age) and no caching at all (every lookup goes to the sensor).
+"""
+class CachingPolicy:
+    """A caching scheme: a display name plus a way to build its PolicyTable."""
+    name = None
+
+    def compile(self, param_classifications, param_names, max_aoi):
+        raise NotImplementedError
+
+class MDPPolicy(CachingPolicy):
+    """The per-category MDP policies of the brain (get_or_generate_brain)."""
+
+    def __init__(self, master_policies, name="A2C-Safe"):
+        self.master_policies = master_policies
+        self.name = name
+
+    def compile(self, param_classifications, param_names, max_aoi):
+        return compile_policy_table(self.master_policies, param_classifications, param_names, max_aoi)
+
+class StaticTTLPolicy(CachingPolicy):
+    """Serves every parameter from the cache until its AoI reaches `ttl`, then fetches."""
+
+    def __init__(self, ttl, name=None):
+        if ttl < 1:
+            raise ValueError("ttl must be at least 1")
+        self.ttl = ttl
+        self.name = name or f"Static TTL ({ttl})"
+
+    def compile(self, param_classifications, param_names, max_aoi):
+        return ttl_policy_table(param_names, self.ttl, max_aoi)
+
+class NoCachingPolicy(StaticTTLPolicy):
+    """Fetches on every lookup (a TTL of 1)."""
+
+    def __init__(self, name="No Caching"):
+        super().__init__(1, name=name)
+
+def ttl_policy_table(param_names, ttl, max_aoi):
+    """PolicyTable putting every parameter in one category that fetches from AoI `ttl` on."""
+    actions = np.full((2, max_aoi), ACTION_FETCH, dtype=np.int8)
+    actions[0, :min(ttl, max_aoi + 1) - 1] = ACTION_CACHE
+    param_category = np.zeros(len(param_names), dtype=np.int32)
+    return PolicyTable(param_names, [("TTL", ttl)], param_category, actions)
+
+def default_policies(master_policies, ttl=10):
+    """The schemes compared in the paper: A2C-Safe, Static TTL and No Caching."""
+    return [MDPPolicy(master_policies), StaticTTLPolicy(ttl), NoCachingPolicy()]
@@ -0,0 +1,131 @@
+# File: sem7/src/simulation/recipes.py
+
+import json
+import numpy as np
+from functools import lru_cache
+
+from .config import DECISION_RECIPES
+
+# ==============================================================================
+# COMPILED DQ -> PARAMETER RECIPE CATALOG
+# ==============================================================================
+"""
+Decision queries are numbered 1..num_dqs and DQ d uses recipe number d % (number of
+recipes), in catalog order. This is the folding the simulator always applied to the
+25 DQs and the 8 DECISION_RECIPES. A RecipeCatalog compiles that mapping once into
+CSR integer tables: the parameter indices of DQ d are values[offsets[d]:offsets[d + 1]],
+indexing param_names (the sorted union of all recipe parameters). The scalar loop
+reads param_list(d) and the batched engine indexes the arrays directly.
+
+A catalog can also carry a DQ popularity distribution (dq_weights, one weight per DQ
+1..num_dqs, e.g. zipf_weights); request generation then draws each request's distinct
+DQs with those weights instead of uniformly. DQs with zero weight are never requested,
+so a request draws at most as many distinct DQs as there are DQs with a positive weight.
+
+Catalog files are JSON: either a DECISION_RECIPES-style {name: {"parameters": [...]}}
+mapping, or {"recipes": {...}, "num_dqs": N, "popularity": [w1, ..., wN] or {"zipf": s}}.
+Parameters the brain has not classified are always fetched by the online policies.
+"""
+DEFAULT_NUM_DQS = 25  # DQ numbers drawn by the built-in request generator
+
+def zipf_weights(num_dqs, exponent=1.0):
+    """Zipf-like popularity of DQs 1..num_dqs: DQ k gets weight 1 / k**exponent (normalised)."""
+    weights = 1.0 / np.arange(1, num_dqs + 1, dtype=float) ** exponent
+    return weights / weights.sum()
+
+class RecipeCatalog:
+    """
+    DQ -> parameter-index CSR tables compiled from a recipe mapping ({name: {"parameters": [...]}}).
+    num_dqs defaults to the number of recipes; dq_weights (None = uniform) to the DQ popularity.
+    """
+
+    def __init__(self, recipes, num_dqs=None, dq_weights=None):
+        if not recipes:
+            raise ValueError("A recipe catalog needs at least one recipe")
+        self.recipe_names = list(recipes)
+        recipe_params = [list(recipes[name]["parameters"]) for name in self.recipe_names]
+        self.param_names = sorted({param for params in recipe_params for param in params})
+        self.param_index = {param: idx for idx, param in enumerate(self.param_names)}
+        self._recipe_indices = [[self.param_index[param] for param in params] for params in recipe_params]
+        self.num_dqs = len(self.recipe_names) if num_dqs is None else num_dqs
+        if self.num_dqs < 1:
+            raise ValueError(f"num_dqs must be at least 1, got {self.num_dqs}")
+        if dq_weights is not None:
+            dq_weights = np.asarray(dq_weights, dtype=float)
+            if dq_weights.shape != (self.num_dqs,) or np.any(dq_weights < 0) or dq_weights.sum() <= 0:
+                raise ValueError(f"dq_weights must be {self.num_dqs} non-negative weights with a positive sum")
+            dq_weights = dq_weights / dq_weights.sum()
+        self.dq_weights = dq_weights
+
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.int64)
+        self._param_lists = []
+        self.ensure(self.num_dqs)
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def recipe_for_dq(self, dq_number):
+        return self.recipe_names[dq_number % len(self.recipe_names)]
+
+    def ensure(self, max_dq):
+        """Makes sure every DQ number in 0..max_dq has an entry (DQs beyond num_dqs fold the same way)."""
+        known = len(self.offsets) - 1
+        if max_dq < known:
+            return
+        new_params = [self._recipe_indices[dq % len(self._recipe_indices)] for dq in range(known, max_dq + 1)]
+        new_counts = np.array([len(params) for params in new_params], dtype=np.int64)
+        self.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(new_counts)])
+        self.values = np.concatenate([self.values, np.array([p for params in new_params for p in params], dtype=np.int64)])
+        self._param_lists.extend(new_params)
+
+    def param_list(self, dq_number):
+        """Parameter indices of a DQ as a Python list (for the scalar loop)."""
+        if dq_number >= len(self._param_lists):
+            self.ensure(dq_number)
+        return self._param_lists[dq_number]
+
+    def params_for_dq(self, dq_number):
+        """Parameter names of a DQ."""
+        return [self.param_names[idx] for idx in self.param_list(dq_number)]
+
+    def with_popularity(self, dq_weights):
+        """Same recipes and num_dqs with another DQ popularity (None = uniform)."""
+        return RecipeCatalog(self.recipes, self.num_dqs, dq_weights)
+
+    @property
+    def recipes(self):
+        """The compiled recipes as a {name: {"parameters": [...]}} mapping."""
+        return {
+            name: {"parameters": [self.param_names[idx] for idx in indices]}
+            for name, indices in zip(self.recipe_names, self._recipe_indices)
+        }
+
+def load_recipe_catalog(path):
+    """Builds a RecipeCatalog from a JSON catalog file (see the module notes for the format)."""
+    with open(path, "r") as f:
+        data = json.load(f)
+    if "recipes" not in data:
+        return RecipeCatalog(data)
+    num_dqs = data.get("num_dqs", len(data["recipes"]))
+    popularity = data.get("popularity")
+    if isinstance(popularity, dict):
+        if set(popularity) != {"zipf"}:
+            raise ValueError(f"Unknown popularity: {popularity!r}")
+        popularity = zipf_weights(num_dqs, popularity["zipf"])
+    return RecipeCatalog(data["recipes"], num_dqs, popularity)
+
+# The built-in catalog: DECISION_RECIPES behind DQ numbers 1..25, uniform popularity
+DEFAULT_CATALOG = RecipeCatalog(DECISION_RECIPES, DEFAULT_NUM_DQS)
+
+@lru_cache(maxsize=None)
+def resolve_catalog(path=None, zipf_exponent=None):
+    """
+    The catalog of a sweep configuration: the file at `path` (default: the built-in catalog),
+    with Zipf popularity of the given exponent if set. Cached, so each worker compiles it once.
+    """
+    catalog = DEFAULT_CATALOG if path is None else load_recipe_catalog(path)
+    if zipf_exponent is not None:
+        catalog = catalog.with_popularity(zipf_weights(catalog.num_dqs, zipf_exponent))
+    return catalog
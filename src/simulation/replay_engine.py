@@ -0,0 +1,351 @@
+# File: sem7/src/simulation/replay_engine.py
+
+import numpy as np
+from collections import defaultdict
+
+from .trace import as_request_trace
+from .cache_store import AoICacheStore, NEVER_SEEN, NEVER_FETCHED, ACTION_FETCH
+from .instrumentation import ensure_profiler
+
+# ==============================================================================
+# BATCHED (VECTORIZED) ONLINE REPLAY ENGINE
+# ==============================================================================
+"""
+Replays a request trace one time step at a time instead of one
+(request, dq, param) triple at a time:
+
+1. Every request of a chunk is expanded into its (sensor, param) lookups through
+   the precomputed DQ -> parameter index arrays (CSR style) of a recipes.RecipeCatalog.
+2. The lookups of a time step are split into "rounds" by how often their key has
+   already occurred in that step. All keys in a round are distinct, so a round is
+   applied with NumPy ops, and round k sees exactly the AoI left behind by round k-1.
+   This reproduces the sequential semantics of the scalar loop for repeated keys.
+3. Energy is summed with a cumulative sum in the original lookup order, so totals are
+   bit-identical to the scalar loop's running float additions.
+
+Several policies can be replayed over one trace in a single pass (run_multi_policy_replay):
+the nearest sensors and lookup expansion are shared, each policy keeps its own ReplayState.
+
+With coalescing only round 0 (the first lookup of each key) decides; every later lookup
+of the key in that step is served from the round-0 read.
+"""
+
+def iter_resolved_chunks(simulation_events, sensor_index, profiler=None):
+    """
+    Yields (trace, nearest_sensor_ids) for each chunk of simulation_events.
+
+    Accepts either a full "requests" collection (list of lists or RequestTrace), the
+    "request_chunks" generator produced by stream_simulation, or "resolved_chunks": an iterable
+    of (RequestTrace, nearest_sensor_ids) pairs whose nearest sensors are already known (as fed
+    to the tiles of the sharded simulator); sensor_index is then unused.
+    """
+    profiler = ensure_profiler(profiler)
+    if "resolved_chunks" in simulation_events:
+        yield from simulation_events["resolved_chunks"]
+        return
+    if "request_chunks" in simulation_events:
+        chunks = simulation_events["request_chunks"]
+    else:
+        chunks = [simulation_events["requests"]]
+
+    for chunk in chunks:
+        # Requests may be a legacy list of lists or a columnar RequestTrace
+        trace = as_request_trace(chunk)
+        with profiler.timer("online.nearest_sensor"):
+            nearest_sensor_ids, _ = sensor_index.nearest_batch(trace.x, trace.y)
+        yield trace, nearest_sensor_ids
+
+def expand_lookups(trace, nearest_sensor_ids, dq_table):
+    """
+    Expands every request of a trace into its parameter lookups, in the same order as the
+    scalar loop (request, then DQ, then parameter). dq_table is a recipes.RecipeCatalog.
+    Returns (request_idx, sensor_ids, param_idx).
+    """
+    dq_values = np.asarray(trace.dq_values, dtype=np.int64)
+    if len(dq_values) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+    dq_table.ensure(int(dq_values.max()))
+
+    # Request index of every DQ entry
+    dq_counts = np.diff(np.asarray(trace.dq_offsets, dtype=np.int64))
+    dq_request = np.repeat(np.arange(len(dq_counts)), dq_counts)
+
+    # Parameter lookups of every DQ entry
+    param_counts = dq_table.counts[dq_values]
+    lookup_dq = np.repeat(np.arange(len(dq_values)), param_counts)
+    lookup_start = np.repeat(np.cumsum(param_counts) - param_counts, param_counts)
+    position = np.arange(len(lookup_dq)) - lookup_start
+    param_idx = dq_table.values[dq_table.offsets[dq_values[lookup_dq]] + position]
+
+    request_idx = dq_request[lookup_dq]
+    return request_idx, np.asarray(nearest_sensor_ids, dtype=np.int64)[request_idx], param_idx
+
+def _occurrence_rank(keys):
+    """For each key, how many earlier entries of the array share it (0 for the first occurrence)."""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    new_group = np.ones(len(keys), dtype=bool)
+    new_group[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    group_start = np.maximum.accumulate(np.where(new_group, np.arange(len(keys)), 0))
+    rank = np.empty(len(keys), dtype=np.int64)
+    rank[order] = np.arange(len(keys)) - group_start
+    return rank
+
+class _GrowingSeries:
+    """Per-time-step accumulator backed by a preallocated array that doubles when needed."""
+
+    def __init__(self, dtype, capacity=128):
+        self.values = np.zeros(capacity, dtype=dtype)
+
+    def reserve(self, time_step):
+        if time_step >= len(self.values):
+            grown = np.zeros(max(time_step + 1, 2 * len(self.values)), dtype=self.values.dtype)
+            grown[:len(self.values)] = self.values
+            self.values = grown
+
+class ReplayState:
+    """
+    Cache contents and accumulated metrics of one policy being replayed over a trace.
+
+    policy_table is a cache_store.PolicyTable; lookups use its interned parameter indices.
+    aoi_model is "lookup" or "time" (see cache_store.py).
+    """
+
+    def __init__(self, policy_table, num_sensors, max_aoi, fetch_energy, lookup_energy, coalesce=False,
+                 aoi_histogram=False, count_params=False, aoi_model="lookup"):
+        self.store = AoICacheStore(num_sensors, len(policy_table.param_names), aoi_model)
+        self.time_aoi = aoi_model == "time"
+        # Action rows looked up by parameter index directly: [param_idx, aoi - 1]
+        self.param_actions = policy_table.actions[policy_table.param_category]
+        # For threshold-shaped policies a decision is a comparison against one integer per parameter
+        self.param_thresholds = policy_table.param_thresholds
+        self.max_aoi = max_aoi
+        self.fetch_energy = fetch_energy
+        self.lookup_energy = lookup_energy
+        self.coalesce = coalesce
+
+        self.total_sensor_accesses = 0
+        self.total_energy_consumed = 0
+        self.aoi_sum = 0
+        self.num_lookups = 0
+        self.total_fetch_demands = 0
+        self.total_coalesced_lookups = 0
+        # Decisions per AoI value (index = AoI), only kept when requested
+        self.aoi_counts = np.zeros(max_aoi + 1, dtype=np.int64) if aoi_histogram else None
+        # Lookups / fetches per parameter index, only kept for profiling
+        num_params = len(policy_table.param_names)
+        self.param_lookups = np.zeros(num_params, dtype=np.int64) if count_params else None
+        self.param_fetches = np.zeros(num_params, dtype=np.int64) if count_params else None
+        self.accesses = _GrowingSeries(np.int64)
+        self.energy = _GrowingSeries(np.float64)
+        self.lookups = _GrowingSeries(np.int64)
+
+    def replay_step(self, time_step, sensor_ids, param_idx):
+        """Applies all lookups of one time step (in their original order) to the cache and metrics."""
+        if len(sensor_ids) == 0:
+            return
+        num_params = len(self.param_actions)
+        keys = sensor_ids * num_params + param_idx
+        if self.coalesce:
+            fetched = self._replay_coalesced(time_step, keys, sensor_ids, param_idx)
+            self._count_params(param_idx, fetched)
+            return
+        rank = _occurrence_rank(keys)
+        by_round = np.argsort(rank, kind='stable')
+        round_bounds = np.searchsorted(rank[by_round], np.arange(int(rank.max()) + 2))
+
+        # Every lookup belongs to exactly one round, so the rounds fill all of `fetched`
+        fetched = np.empty(len(sensor_ids), dtype=bool)
+        for r in range(len(round_bounds) - 1):
+            idx = by_round[round_bounds[r]:round_bounds[r + 1]]
+            s, p = sensor_ids[idx], param_idx[idx]
+            current, fetch = self._decide(time_step, s, p)
+            self._update(time_step, s, p, current, fetch)
+            fetched[idx] = fetch
+            self.aoi_sum += int(current.sum())
+            self._count_aoi(current)
+
+        self._record_step(time_step, fetched)
+        self._count_params(param_idx, fetched)
+
+    def _replay_coalesced(self, time_step, keys, sensor_ids, param_idx):
+        """replay_step with coalescing: one decision per key, later lookups share its read."""
+        _, leader_pos, leader_of = np.unique(keys, return_index=True, return_inverse=True)
+        s, p = sensor_ids[leader_pos], param_idx[leader_pos]
+        current, fetch = self._decide(time_step, s, p)
+        self._update(time_step, s, p, current, fetch)
+
+        is_leader = np.zeros(len(keys), dtype=bool)
+        is_leader[leader_pos] = True
+        followers = ~is_leader
+        # Followers see the fresh value of a fetched key, else the AoI the leader saw
+        served = np.where(fetch, 1, current)[leader_of]
+        self.aoi_sum += int(current.sum()) + int(served[followers].sum())
+        self._count_aoi(current)
+        self._count_aoi(served[followers])
+
+        fetched = np.zeros(len(keys), dtype=bool)
+        fetched[leader_pos] = fetch
+        demanded = fetch[leader_of]
+        num_coalesced = int(np.count_nonzero(demanded & followers))
+        self.total_fetch_demands += int(np.count_nonzero(demanded))
+        self.total_coalesced_lookups += num_coalesced
+        self._record_step(time_step, fetched)
+        return fetched
+
+    def _decide(self, time_step, s, p):
+        """AoI seen by lookups of distinct keys (s, p) and whether each one fetches."""
+        if self.time_aoi:
+            # Data fetched in this very time step still has AoI 1
+            fetched_at = self.store.fetched_at[s, p]
+            never_seen = fetched_at == NEVER_FETCHED
+            age = np.minimum(np.maximum(time_step - fetched_at, 1), self.max_aoi)
+            current = np.where(never_seen, self.max_aoi, age)
+        else:
+            stored = self.store.aoi[s, p]
+            never_seen = stored == NEVER_SEEN
+            current = np.where(never_seen, self.max_aoi, stored)
+        if self.param_thresholds is not None:
+            fetch = never_seen | (current >= self.param_thresholds[p])
+        else:
+            fetch = never_seen | (self.param_actions[p, current - 1] == ACTION_FETCH)
+        return current, fetch
+
+    def _update(self, time_step, s, p, current, fetch):
+        if self.time_aoi:
+            # Cache hits leave the fetch time alone: entries age with the clock
+            self.store.fetched_at[s[fetch], p[fetch]] = time_step
+        else:
+            self.store.aoi[s, p] = np.where(fetch, 1, np.minimum(current + 1, self.max_aoi))
+
+    def _count_params(self, param_idx, fetched):
+        if self.param_lookups is not None:
+            self.param_lookups += np.bincount(param_idx, minlength=len(self.param_lookups))
+            self.param_fetches += np.bincount(param_idx[fetched], minlength=len(self.param_fetches))
+
+    def _count_aoi(self, observed):
+        if self.aoi_counts is not None:
+            self.aoi_counts += np.bincount(observed, minlength=len(self.aoi_counts))
+
+    def _record_step(self, time_step, fetched):
+        """Adds the access/energy metrics of one step's lookups (fetched[i] = lookup i hit the sensor)."""
+        num_fetches = int(np.count_nonzero(fetched))
+        costs = np.where(fetched, self.fetch_energy, self.lookup_energy)
+
+        self.num_lookups += len(fetched)
+        self.total_sensor_accesses += num_fetches
+        self.total_energy_consumed = _sequential_sum(self.total_energy_consumed, costs)
+
+        for series in (self.accesses, self.energy, self.lookups):
+            series.reserve(time_step)
+        self.accesses.values[time_step] += num_fetches
+        self.energy.values[time_step] = _sequential_sum(self.energy.values[time_step], costs)
+        self.lookups.values[time_step] += len(fetched)
+
+    def results(self, requests_over_time):
+        """Result dict in the same format (and with the same dict keys) as the scalar loop."""
+        accesses = self.accesses.values.tolist()
+        energy = self.energy.values.tolist()
+        lookups = self.lookups.values.tolist()
+        results = {
+            "avg_aoi_for_qos": self.aoi_sum / self.num_lookups if self.num_lookups else 0,
+            "total_sensor_accesses": self.total_sensor_accesses,
+            "total_energy_consumed": self.total_energy_consumed,
+            "requests_over_time": requests_over_time,
+            "accesses_over_time": defaultdict(int, {t: v for t, v in enumerate(accesses) if v}),
+            "energy_over_time": defaultdict(float, {t: energy[t] for t, n in enumerate(lookups) if n})
+        }
+        if self.coalesce:
+            results["total_fetch_demands"] = self.total_fetch_demands
+            results["total_coalesced_lookups"] = self.total_coalesced_lookups
+        if self.aoi_counts is not None:
+            results["aoi_histogram"] = self.aoi_counts.tolist()
+        return results
+
+def count_category_decisions(profiler, policy_table, param_lookups, param_fetches):
+    """
+    Adds online.lookups / hits / fetches counters, in total and per category ("Vol/Crit", or
+    "unclassified" for parameters on the always-fetch row), from per-parameter counts.
+    """
+    param_lookups = np.asarray(param_lookups, dtype=np.int64)
+    param_fetches = np.asarray(param_fetches, dtype=np.int64)
+    labels = ["/".join(map(str, category)) for category in policy_table.categories] + ["unclassified"]
+    num_rows = len(labels)
+    lookups = np.bincount(policy_table.param_category, weights=param_lookups, minlength=num_rows).astype(np.int64)
+    fetches = np.bincount(policy_table.param_category, weights=param_fetches, minlength=num_rows).astype(np.int64)
+
+    profiler.count("online.lookups", int(lookups.sum()))
+    profiler.count("online.fetches", int(fetches.sum()))
+    profiler.count("online.hits", int(lookups.sum() - fetches.sum()))
+    for label, row_lookups, row_fetches in zip(labels, lookups.tolist(), fetches.tolist()):
+        if row_lookups:
+            profiler.count(f"online.fetches[{label}]", row_fetches)
+            profiler.count(f"online.hits[{label}]", row_lookups - row_fetches)
+
+def _sequential_sum(start, costs):
+    """start + costs[0] + costs[1] + ... evaluated left to right, like a Python running total."""
+    if len(costs) == 0:
+        return start
+    return np.cumsum(np.concatenate(([start], costs)))[-1].item()
+
+def iter_step_segments(time_steps):
+    """Yields (time_step, start, stop) for each run of equal time steps in a chunk."""
+    if len(time_steps) == 0:
+        return
+    bounds = np.flatnonzero(np.diff(time_steps)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    stops = np.concatenate((bounds, [len(time_steps)])).tolist()
+    for start, stop in zip(starts, stops):
+        yield int(time_steps[start]), start, stop
+
+def run_batched_replay(simulation_events, sensor_index, policy_table, dq_table, max_aoi, fetch_energy, lookup_energy,
+                       coalesce=False, aoi_histogram=False, aoi_model="lookup", profiler=None):
+    """
+    Replays simulation_events with the batched engine and returns the same metrics dict as
+    the scalar loop in run_single_online_iteration.
+    """
+    return run_multi_policy_replay(
+        simulation_events, sensor_index, [policy_table], dq_table, max_aoi, fetch_energy, lookup_energy,
+        coalesce=coalesce, aoi_histogram=aoi_histogram, aoi_model=aoi_model, profiler=profiler
+    )[0]
+
+def run_multi_policy_replay(simulation_events, sensor_index, policy_tables, dq_table, max_aoi, fetch_energy,
+                            lookup_energy, coalesce=False, aoi_histogram=False, aoi_model="lookup", profiler=None):
+    """
+    Replays simulation_events once against every PolicyTable in policy_tables and returns
+    one metrics dict per table (in the same order). Nearest-sensor resolution and DQ
+    expansion are done once per chunk; every policy has its own cache state.
+
+    With a profiler, the replay is timed as "online.policy_lookup" and, for a single policy,
+    lookups / hits / fetches are counted per category (instrumentation.py).
+    """
+    profiler = ensure_profiler(profiler)
+    num_sensors = len(simulation_events["static_sensors"]['x'])
+    states = [
+        ReplayState(policy_table, num_sensors, max_aoi, fetch_energy, lookup_energy, coalesce=coalesce,
+                    aoi_histogram=aoi_histogram, count_params=profiler.enabled and len(policy_tables) == 1,
+                    aoi_model=aoi_model)
+        for policy_table in policy_tables
+    ]
+    requests_over_time = defaultdict(int)
+
+    with profiler.timer("online.policy_lookup"):
+        for trace, nearest_sensor_ids in iter_resolved_chunks(simulation_events, sensor_index, profiler):
+            request_idx, sensor_ids, param_idx = expand_lookups(trace, nearest_sensor_ids, dq_table)
+            request_steps = np.asarray(trace.time_step, dtype=np.int64)
+            lookup_steps = request_steps[request_idx]
+
+            for time_step, start, stop in iter_step_segments(request_steps):
+                requests_over_time[time_step] += stop - start
+
+            for time_step, start, stop in iter_step_segments(lookup_steps):
+                for state in states:
+                    state.replay_step(time_step, sensor_ids[start:stop], param_idx[start:stop])
+
+    profiler.count("online.requests", sum(requests_over_time.values()))
+    if states[0].param_lookups is not None:
+        count_category_decisions(profiler, policy_tables[0], states[0].param_lookups, states[0].param_fetches)
+
+    # Each result gets its own copy of the shared request counts
+    return [state.results(defaultdict(int, requests_over_time)) for state in states]
@@ -0,0 +1,30 @@
+# File: sem7/src/simulation/rng.py
+
+import numpy as np
+
+# ==============================================================================
+# SEEDED, INDEPENDENT RANDOM STREAMS PER SWEEP TASK
+# ==============================================================================
+"""
+Every (num_users, iteration) task of a sweep draws from its own np.random.Generator,
+derived from one base seed through a SeedSequence keyed by (num_users, iteration).
+The stream of a task therefore does not depend on which process runs it or in
+which order, so serial and parallel runs of the same sweep produce identical traces.
+"""
+def make_seed_sequence(base_seed, *key):
+    """SeedSequence for the task identified by `key` (e.g. num_users, iteration) under base_seed."""
+    return np.random.SeedSequence(entropy=base_seed, spawn_key=tuple(int(k) for k in key))
+
+def make_rng(base_seed, *key):
+    """Independent Generator for the task identified by `key` under base_seed."""
+    return np.random.default_rng(make_seed_sequence(base_seed, *key))
+
+def new_base_seed():
+    """Fresh random base seed (record it to reproduce the run later)."""
+    return np.random.SeedSequence().entropy
+
+def ensure_rng(rng):
+    """Returns `rng` itself, a Generator seeded with it if it is an int, or a fresh Generator if None."""
+    if isinstance(rng, np.random.Generator):
+        return rng
+    return np.random.default_rng(rng)
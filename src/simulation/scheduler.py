@@ -0,0 +1,244 @@
+# File: sem7/src/simulation/scheduler.py
+
+import os
+import json
+import hashlib
+import itertools
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from .sweep import (DEFAULT_SIM_PARAMS, CATALOG_PARAMS, split_catalog_params, run_sweep_task, write_profile_record,
+                    build_experiment_results_from_aggregates, _init_worker, _run_worker_task)
+from .aggregation import IterationAggregate
+from .rng import new_base_seed
+
+# ==============================================================================
+# CHECKPOINTED, RESUMABLE SWEEP SCHEDULER
+# ==============================================================================
+"""
+Runs the experiment as a grid of cells (num_users x num_sensors x duration x alpha),
+each cell being `iterations` independent iterations folded into IterationAggregates.
+Every cell's aggregates are written to results_dir (atomically, every
+`checkpoint_every` iterations and when the cell finishes), so an interrupted sweep
+restarts where it stopped, finished cells are skipped, and a sweep can be extended
+with new grid values or more iterations without recomputing what is on disk.
+
+Iteration i of a cell with num_users users draws from make_rng(base_seed, num_users, i)
+like run_sweep, so every deployment configuration sees the same random streams and
+a single-configuration grid reproduces run_sweep exactly. Adding iterations later
+gives the same numbers as running them all at once.
+"""
+MANIFEST_FILE = "manifest.json"
+# Part of every cell key: bump it whenever a simulator change alters the numbers a cell produces
+CHECKPOINT_VERSION = 1
+
+SweepCell = namedtuple("SweepCell", ["num_users", "num_sensors", "duration", "alpha"])
+
+class SweepGrid:
+    """
+    The experiment grid. Every combination of user count, sensor count, duration and mobility
+    alpha is one cell running `iterations` iterations; unset dimensions use DEFAULT_SIM_PARAMS.
+    """
+
+    def __init__(self, user_counts, iterations, num_sensors=None, durations=None, alphas=None):
+        self.user_counts = list(user_counts)
+        self.iterations = iterations
+        self.num_sensors = list(num_sensors or [DEFAULT_SIM_PARAMS["num_sensors"]])
+        self.durations = list(durations or [DEFAULT_SIM_PARAMS["duration"]])
+        self.alphas = list(alphas or [DEFAULT_SIM_PARAMS["alpha"]])
+
+    def configs(self):
+        """(num_sensors, duration, alpha) of every deployment configuration, in sweep order."""
+        return list(itertools.product(self.num_sensors, self.durations, self.alphas))
+
+    def cells(self):
+        return [
+            SweepCell(num_users, num_sensors, duration, alpha)
+            for num_sensors, duration, alpha in self.configs()
+            for num_users in self.user_counts
+        ]
+
+def config_label(num_sensors, duration, alpha):
+    """Key of a deployment configuration in the results returned by run_scheduled_sweep."""
+    return f"sensors={num_sensors},duration={duration},alpha={alpha:g}"
+
+def brain_fingerprint(master_policies, param_classifications):
+    """SHA-256 over the policies and parameter classifications the online phase uses."""
+    digest = hashlib.sha256()
+    for category in sorted(master_policies, key=repr):
+        digest.update(repr(tuple(category)).encode("utf-8"))
+        digest.update(np.asarray(master_policies[category], dtype=np.int64).tobytes())
+    classifications = sorted((param, list(category)) for param, category in param_classifications.items())
+    digest.update(json.dumps(classifications).encode("utf-8"))
+    return digest.hexdigest()
+
+def catalog_fingerprint(catalog):
+    """SHA-256 over a compiled recipes.RecipeCatalog: recipe names, DQ -> parameter tables and DQ popularity."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([catalog.recipe_names, catalog.param_names]).encode("utf-8"))
+    # Only DQs 1..num_dqs; the tables may have been extended lazily past them
+    offsets = catalog.offsets[:catalog.num_dqs + 1]
+    digest.update(offsets.astype(np.int64).tobytes())
+    digest.update(catalog.values[:offsets[-1]].astype(np.int64).tobytes())
+    if catalog.dq_weights is not None:
+        digest.update(np.asarray(catalog.dq_weights, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def sweep_cache_key(base_seed, sim_params, online_options, policies, brain_key):
+    """
+    Identifies everything besides the cell itself that affects a cell's numbers. The engine is
+    left out on purpose: the scalar and batched engines give identical results. A DQ catalog
+    enters through its compiled content, so editing the catalog file invalidates the cells.
+    """
+    if any(key in sim_params for key in CATALOG_PARAMS):
+        sim_params, catalog = split_catalog_params(sim_params)
+        sim_params["dq_catalog"] = catalog_fingerprint(catalog)
+    config = {
+        "checkpoint_version": CHECKPOINT_VERSION,
+        "base_seed": base_seed,
+        "sim_params": {key: list(value) if isinstance(value, tuple) else value for key, value in sim_params.items()},
+        "online_options": online_options or {},
+        "schemes": None if policies is None else [policy.name for policy in policies],
+        "brain": brain_key,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+def cell_path(results_dir, sweep_key, cell):
+    return os.path.join(
+        results_dir,
+        f"cell_u{cell.num_users}_s{cell.num_sensors}_d{cell.duration}_a{cell.alpha:g}_{sweep_key[:16]}.json"
+    )
+
+def _write_json_atomic(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def load_cell_state(path):
+    """Returns (iterations_done, {scheme name or None: IterationAggregate}) of a saved cell."""
+    if not os.path.exists(path):
+        return 0, None
+    with open(path, "r") as f:
+        data = json.load(f)
+    aggregates = {
+        (name or None): IterationAggregate.from_dict(aggregate) for name, aggregate in data["aggregates"].items()
+    }
+    return data["iterations_done"], aggregates
+
+def save_cell_state(path, sweep_key, cell, iterations_done, aggregates):
+    _write_json_atomic(path, {
+        "sweep_key": sweep_key,
+        "cell": cell._asdict(),
+        "iterations_done": iterations_done,
+        # The plain (single-policy) sweep is stored under the empty scheme name
+        "aggregates": {(name or ""): aggregate.to_dict() for name, aggregate in aggregates.items()},
+    })
+
+def _resolve_base_seed(results_dir, base_seed):
+    """Uses the given base seed, else the one recorded in results_dir, else a fresh one."""
+    manifest_path = os.path.join(results_dir, MANIFEST_FILE)
+    if base_seed is None and os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            base_seed = json.load(f)["base_seed"]
+        print(f"Resuming sweep with base seed: {base_seed}")
+    elif base_seed is None:
+        base_seed = new_base_seed()
+        print(f"Sweep base seed: {base_seed}")
+    _write_json_atomic(manifest_path, {"base_seed": base_seed})
+    return base_seed
+
+def run_scheduled_sweep(grid, master_policies, param_classifications, results_dir="sweep_results",
+                        workers=1, chunksize=1, engine="scalar", base_seed=None, online_options=None,
+                        policies=None, sim_params=None, checkpoint_every=10, profile_path=None):
+    """
+    Runs every unfinished cell of `grid`, checkpointing into results_dir, and returns
+    {config_label(...): experiment_results} for every deployment configuration of the grid
+    (experiment_results is {scheme name: ...} when `policies` are given, as in run_sweep).
+
+    sim_params overrides the fixed mobility parameters (area, mean_speed); workers, chunksize,
+    engine, online_options and policies are as in run_sweep. Without base_seed, the seed
+    recorded in results_dir is reused so a restarted sweep continues where it stopped.
+    With profile_path, the profile record of every iteration run is appended to that file.
+    """
+    os.makedirs(results_dir, exist_ok=True)
+    base_seed = _resolve_base_seed(results_dir, base_seed)
+    fixed_params = {key: value for key, value in dict(DEFAULT_SIM_PARAMS, **(sim_params or {})).items()
+                    if key not in ("num_sensors", "duration", "alpha")}
+    sweep_key = sweep_cache_key(base_seed, fixed_params, online_options, policies,
+                                brain_fingerprint(master_policies, param_classifications))
+    scheme_names = [None] if policies is None else [policy.name for policy in policies]
+
+    # --- Load what is already on disk and list the iterations still to run ---
+    states = {}
+    tasks = []
+    for cell in grid.cells():
+        done, aggregates = load_cell_state(cell_path(results_dir, sweep_key, cell))
+        if aggregates is None:
+            aggregates = {name: IterationAggregate() for name in scheme_names}
+        states[cell] = [done, aggregates]
+        if done > grid.iterations:
+            print(f"Cell {cell} already has {done} iterations (> {grid.iterations}); keeping them all.")
+        cell_params = dict(fixed_params, num_sensors=cell.num_sensors, duration=cell.duration, alpha=cell.alpha)
+        tasks.extend((cell, (cell.num_users, i, cell_params)) for i in range(done, grid.iterations))
+
+    finished = sum(1 for done, _ in states.values() if done >= grid.iterations)
+    print(f"Sweep grid: {len(states)} cells ({finished} already finished), {len(tasks)} iterations to run.")
+
+    # --- Run the remaining iterations, merging (in task order) and checkpointing as they finish ---
+    unsaved = set()
+    profile = profile_path is not None
+    profile_file = open(profile_path, "a") if profile else None
+
+    def record(cell, iteration, partial, profile_record):
+        if profile_file is not None:
+            write_profile_record(profile_file, "iteration", profile_record, iteration=iteration, **cell._asdict())
+        state = states[cell]
+        for name, aggregate in partial.items():
+            state[1][name].merge(aggregate)
+        state[0] += 1
+        unsaved.add(cell)
+        if state[0] % checkpoint_every == 0 or state[0] == grid.iterations:
+            save_cell_state(cell_path(results_dir, sweep_key, cell), sweep_key, cell, state[0], state[1])
+            unsaved.discard(cell)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    try:
+        if workers == 1:
+            for cell, (num_users, i, cell_params) in tasks:
+                record(cell, i, *run_sweep_task(
+                    num_users, i, cell_params, master_policies, param_classifications, engine, base_seed,
+                    online_options=online_options, policies=policies, profile=profile
+                ))
+        elif tasks:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(master_policies, param_classifications, engine, base_seed, online_options, policies,
+                          profile)
+            ) as executor:
+                task_results = executor.map(_run_worker_task, [task for _, task in tasks], chunksize=chunksize)
+                for (cell, _), (_, i, partial, profile_record) in zip(tasks, task_results):
+                    record(cell, i, partial, profile_record)
+    finally:
+        if profile_file is not None:
+            profile_file.close()
+        # An interrupted sweep keeps every iteration merged so far
+        for cell in unsaved:
+            state = states[cell]
+            save_cell_state(cell_path(results_dir, sweep_key, cell), sweep_key, cell, state[0], state[1])
+
+    # --- Assemble experiment_results per deployment configuration ---
+    results = {}
+    for num_sensors, duration, alpha in grid.configs():
+        per_scheme = {
+            name: build_experiment_results_from_aggregates({
+                num_users: states[SweepCell(num_users, num_sensors, duration, alpha)][1][name]
+                for num_users in grid.user_counts
+            })
+            for name in scheme_names
+        }
+        results[config_label(num_sensors, duration, alpha)] = per_scheme[None] if policies is None else per_scheme
+    return results
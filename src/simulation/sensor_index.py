@@ -0,0 +1,44 @@
+# File: sem7/src/simulation/sensor_index.py
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# ==============================================================================
+# SPATIAL INDEX OVER THE STATIC SENSORS
+# ==============================================================================
+"""
+find_nearest_sensor scans every sensor for every request. The index below is
+built once per static_sensors layout (a KD-tree over the sensor coordinates)
+and answers single lookups in O(log n) and whole arrays of coordinates in one call.
+"""
+class SensorIndex:
+    """KD-tree over a static_sensors layout ({'x': [...], 'y': [...]})."""
+
+    def __init__(self, static_sensors):
+        self.points = np.column_stack([
+            np.asarray(static_sensors['x'], dtype=float),
+            np.asarray(static_sensors['y'], dtype=float)
+        ])
+        self.tree = cKDTree(self.points)
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, coords):
+        """Returns (sensor_id, distance) for a single (x, y) coordinate."""
+        dist, sensor_id = self.tree.query(coords)
+        return int(sensor_id), float(dist)
+
+    def nearest_batch(self, xs, ys):
+        """
+        Returns (sensor_ids, distances) as NumPy arrays for arrays of x and y coordinates.
+        """
+        coords = np.column_stack([np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)])
+        if len(coords) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+        dists, sensor_ids = self.tree.query(coords)
+        return sensor_ids.astype(np.int64), dists
+
+def build_sensor_index(static_sensors):
+    """Builds a SensorIndex for the given static_sensors layout."""
+    return SensorIndex(static_sensors)
@@ -0,0 +1,255 @@
+# File: sem7/src/simulation/sharded_simulator.py
+
+import queue
+import traceback
+import multiprocessing
+import numpy as np
+from collections import defaultdict
+
+from .guass_morkov import stream_simulation
+from .online_simulator import run_single_online_iteration, MAX_AOI
+from .sensor_index import build_sensor_index
+from .trace import as_request_trace
+from .sweep import DEFAULT_SIM_PARAMS, split_catalog_params
+from .instrumentation import Profiler, ensure_profiler
+
+# ==============================================================================
+# SPATIALLY SHARDED ONLINE SIMULATION (ONE PROCESS PER TILE)
+# ==============================================================================
+"""
+Splits one large iteration across cores instead of running many small ones side by side.
+
+The area is cut into a tiles_x x tiles_y grid. Every tile owns the sensors inside it and
+runs the online simulator for them in its own process, with a cache covering only its
+sensors (local sensor ids 0..n-1). The coordinator streams the mobility simulation,
+resolves every request's nearest sensor against the full sensor layout and routes the
+request to the tile owning that sensor, together with the already resolved (local) id.
+
+Cache entries belong to a single sensor, so the tiles never share state. A user crossing
+a tile boundary needs no hand-over: mobility lives in the coordinator, and the user's next
+request is simply routed to the tile of its new nearest sensor. The merged result is
+therefore the unsharded run_single_online_iteration result, up to the float summation
+order of the energy totals. A bounded cache_capacity applies per tile (one edge cache per tile)
+and, like the unsharded run, needs the scalar engine, which is then the default.
+"""
+# Chunks buffered per tile before the coordinator waits for that tile to catch up
+DEFAULT_QUEUE_SIZE = 4
+
+class ShardLayout:
+    """Assignment of the sensors of a static_sensors layout to the tiles of a grid over `area`."""
+
+    def __init__(self, static_sensors, area, tiles):
+        self.area = area
+        self.tiles_x, self.tiles_y = tiles
+        xs = np.asarray(static_sensors['x'], dtype=float)
+        ys = np.asarray(static_sensors['y'], dtype=float)
+        self.sensor_tile = self.tile_of(xs, ys)
+        # Local id of every sensor inside its tile
+        self.local_id = np.empty(len(xs), dtype=np.int64)
+        self.tile_sensors = {}
+        for tile in np.unique(self.sensor_tile).tolist():
+            members = np.flatnonzero(self.sensor_tile == tile)
+            self.local_id[members] = np.arange(len(members))
+            self.tile_sensors[tile] = {'x': xs[members].tolist(), 'y': ys[members].tolist()}
+
+    @property
+    def num_tiles(self):
+        return self.tiles_x * self.tiles_y
+
+    def tile_of(self, xs, ys):
+        """Tile index (row-major, tile = ty * tiles_x + tx) of every coordinate."""
+        x_min, x_max, y_min, y_max = self.area
+        tx = np.floor((np.asarray(xs, dtype=float) - x_min) / (x_max - x_min) * self.tiles_x).astype(np.int64)
+        ty = np.floor((np.asarray(ys, dtype=float) - y_min) / (y_max - y_min) * self.tiles_y).astype(np.int64)
+        return np.clip(ty, 0, self.tiles_y - 1) * self.tiles_x + np.clip(tx, 0, self.tiles_x - 1)
+
+    def route(self, trace, nearest_sensor_ids):
+        """
+        Splits a resolved chunk by the tile of each request's nearest sensor.
+        Yields (tile, sub-trace, local nearest sensor ids), keeping the request order within a tile.
+        """
+        request_tile = self.sensor_tile[nearest_sensor_ids]
+        order = np.argsort(request_tile, kind='stable')
+        bounds = np.searchsorted(request_tile[order], np.arange(self.num_tiles + 1))
+        for tile in range(self.num_tiles):
+            rows = order[bounds[tile]:bounds[tile + 1]]
+            if len(rows):
+                yield tile, trace.take(rows), self.local_id[nearest_sensor_ids[rows]]
+
+def merge_tile_results(tile_results, aoi_histogram=False):
+    """
+    Merges per-tile results (each with an "aoi_histogram") into one result dict in the
+    run_single_online_iteration format. The average AoI is recomputed from the merged
+    histogram, which is only kept in the output when aoi_histogram is set.
+    """
+    merged_histogram = np.zeros(MAX_AOI + 1, dtype=np.int64)
+    merged = {
+        "total_sensor_accesses": 0,
+        "total_energy_consumed": 0,
+        "requests_over_time": defaultdict(int),
+        "accesses_over_time": defaultdict(int),
+        "energy_over_time": defaultdict(float),
+    }
+    for result in tile_results:
+        merged_histogram += np.asarray(result["aoi_histogram"], dtype=np.int64)
+        for key in ("total_sensor_accesses", "total_energy_consumed", "total_evictions",
+                    "total_fetch_demands", "total_coalesced_lookups"):
+            if key in result:
+                merged[key] = merged.get(key, 0) + result[key]
+        for key in ("requests_over_time", "accesses_over_time", "energy_over_time"):
+            for t, value in result[key].items():
+                merged[key][t] += value
+
+    num_lookups = int(merged_histogram.sum())
+    aoi_sum = int(np.dot(np.arange(len(merged_histogram)), merged_histogram))
+    merged["avg_aoi_for_qos"] = aoi_sum / num_lookups if num_lookups else 0
+    # Time series in time order, as produced by a single run
+    for key in ("requests_over_time", "accesses_over_time", "energy_over_time"):
+        merged[key] = defaultdict(merged[key].default_factory, sorted(merged[key].items()))
+    if aoi_histogram:
+        merged["aoi_histogram"] = merged_histogram.tolist()
+    return merged
+
+def _run_tile(tile, tile_sensors, num_users, master_policies, param_classifications, engine, online_options,
+              catalog, resolved_chunks, profile):
+    """Runs the online simulator over one tile's resolved chunks; returns (result, profile record)."""
+    profiler = Profiler() if profile else None
+    result = run_single_online_iteration(
+        num_users, master_policies, param_classifications,
+        simulation_events={"resolved_chunks": resolved_chunks, "static_sensors": tile_sensors},
+        engine=engine, catalog=catalog, profiler=profiler, **dict(online_options, aoi_histogram=True)
+    )
+    return result, None if profiler is None else profiler.to_dict()
+
+def _tile_worker(tile, tile_sensors, num_users, master_policies, param_classifications, engine, online_options,
+                 catalog, profile, chunk_queue, result_queue):
+    """Process entry point of one tile: consumes chunks until the None sentinel, then reports."""
+    chunks = iter(chunk_queue.get, None)
+    try:
+        result, profile_record = _run_tile(tile, tile_sensors, num_users, master_policies, param_classifications,
+                                           engine, online_options, catalog, chunks, profile)
+        result_queue.put((tile, result, profile_record, None))
+    except Exception:
+        result_queue.put((tile, None, None, traceback.format_exc()))
+        # Keep draining so the coordinator never blocks on a full queue
+        for _ in chunks:
+            pass
+
+def _put_chunk(chunk_queue, item, process):
+    while True:
+        try:
+            chunk_queue.put(item, timeout=1.0)
+            return
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError(f"Tile worker {process.name} exited unexpectedly")
+
+def _get_report(result_queue, processes, pending):
+    """Next tile report; raises if a tile that has not reported yet exited without reporting."""
+    while True:
+        try:
+            return result_queue.get(timeout=1.0)
+        except queue.Empty:
+            dead = [tile for tile in pending if not processes[tile].is_alive()]
+            if dead:
+                # A worker flushes its report before it exits, so one more look settles the race
+                try:
+                    return result_queue.get(timeout=1.0)
+                except queue.Empty:
+                    names = ", ".join(processes[tile].name for tile in dead)
+                    raise RuntimeError(f"Tile worker(s) {names} exited without reporting")
+
+def run_sharded_iteration(num_users, master_policies, param_classifications, tiles=(2, 2), sim_params=None,
+                          chunk_steps=1, engine=None, rng=None, online_options=None, in_process=False,
+                          queue_size=DEFAULT_QUEUE_SIZE, profiler=None):
+    """
+    Runs ONE iteration (same events as run_sweep_iteration for the same rng) with the area
+    split into tiles=(tiles_x, tiles_y) and returns the merged result dict.
+
+    Each tile holding at least one sensor gets its own process; the coordinator streams the
+    simulation `chunk_steps` time steps at a time, so memory stays bounded by queue_size
+    chunks per tile. online_options are the run_single_online_iteration options (engine is
+    passed separately and defaults to "batched", or to "scalar" with a bounded cache_capacity,
+    which the batched engine does not support). in_process=True runs the tiles one after
+    the other in this process, buffering their chunks (for debugging and small runs).
+
+    profiler times the coordinator's stages ("sharded.routing", ...) and merges the tiles'
+    profile records, whose timers overlap in wall time.
+    """
+    profiler = ensure_profiler(profiler)
+    online_options = dict(online_options or {})
+    aoi_histogram = online_options.pop("aoi_histogram", False)
+    sim_params, catalog = split_catalog_params(dict(DEFAULT_SIM_PARAMS, **(sim_params or {})))
+    if tiles[0] < 1 or tiles[1] < 1:
+        raise ValueError(f"tiles must be at least (1, 1), got {tiles!r}")
+    bounded = online_options.get("cache_capacity") is not None
+    if engine is None:
+        engine = "scalar" if bounded else "batched"
+    elif bounded and engine != "scalar":
+        # Checked here rather than failing the same way inside every tile worker
+        raise ValueError("A bounded cache_capacity is only supported by the scalar engine")
+
+    simulation_events = stream_simulation(
+        num_users=num_users, chunk_steps=chunk_steps, trace_format="columnar", rng=rng,
+        profiler=profiler, catalog=catalog, **sim_params
+    )
+    static_sensors = simulation_events["static_sensors"]
+    layout = ShardLayout(static_sensors, sim_params["area"], tiles)
+    sensor_index = build_sensor_index(static_sensors)
+    tile_args = {
+        tile: (tile, sensors, num_users, master_policies, param_classifications, engine, online_options, catalog)
+        for tile, sensors in layout.tile_sensors.items()
+    }
+
+    def routed_chunks():
+        for chunk in simulation_events["request_chunks"]:
+            trace = as_request_trace(chunk)
+            with profiler.timer("online.nearest_sensor"):
+                nearest_sensor_ids, _ = sensor_index.nearest_batch(trace.x, trace.y)
+            with profiler.timer("sharded.routing"):
+                routed = list(layout.route(trace, nearest_sensor_ids))
+            yield from routed
+
+    outputs = {}
+    if in_process:
+        buffered = {tile: [] for tile in tile_args}
+        for tile, sub_trace, local_ids in routed_chunks():
+            buffered[tile].append((sub_trace, local_ids))
+        for tile, args in tile_args.items():
+            outputs[tile] = _run_tile(*args, buffered[tile], profiler.enabled)
+    else:
+        context = multiprocessing.get_context()
+        result_queue = context.Queue()
+        chunk_queues, processes = {}, {}
+        for tile, args in tile_args.items():
+            chunk_queues[tile] = context.Queue(maxsize=queue_size)
+            processes[tile] = context.Process(
+                target=_tile_worker, name=f"tile-{tile}",
+                args=args + (profiler.enabled, chunk_queues[tile], result_queue), daemon=True
+            )
+            processes[tile].start()
+        try:
+            for tile, sub_trace, local_ids in routed_chunks():
+                _put_chunk(chunk_queues[tile], (sub_trace, local_ids), processes[tile])
+            for tile in tile_args:
+                _put_chunk(chunk_queues[tile], None, processes[tile])
+            errors = []
+            pending = set(tile_args)
+            while pending:
+                tile, result, profile_record, error = _get_report(result_queue, processes, pending)
+                pending.discard(tile)
+                if error is not None:
+                    errors.append(f"Tile {tile} failed:\n{error}")
+                outputs[tile] = (result, profile_record)
+            if errors:
+                raise RuntimeError("\n".join(errors))
+        finally:
+            for process in processes.values():
+                if process.is_alive() and outputs.keys() != tile_args.keys():
+                    process.terminate()
+                process.join()
+
+    for tile in sorted(outputs):
+        if outputs[tile][1] is not None:
+            profiler.merge(outputs[tile][1])
+    return merge_tile_results([outputs[tile][0] for tile in sorted(outputs)], aoi_histogram)
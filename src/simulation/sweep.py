@@ -0,0 +1,199 @@
+# File: sem7/src/simulation/sweep.py
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from .guass_morkov import run_simulation
+from .online_simulator import run_single_online_iteration, run_policy_comparison
+from .rng import make_rng, new_base_seed
+from .recipes import resolve_catalog
+from .aggregation import IterationAggregate
+from .instrumentation import Profiler, ensure_profiler
+
+# ==============================================================================
+# EXPERIMENT SWEEP: ONE (num_users, iteration) TASK AT A TIME, SERIAL OR PARALLEL
+# ==============================================================================
+"""
+Every iteration of the main() experiment is independent apart from the read-only
+brain (master_policies, param_classifications). The functions below run the
+(num_users, iteration) tasks either in-process or spread over a process pool, and
+aggregate the per-iteration results into the experiment_results structure saved
+for plotting.
+
+Each task draws from its own random stream keyed by (base_seed, num_users, iteration),
+so a serial run and a parallel run of the same sweep see bit-identical traces.
+
+Given a list of caching schemes (policies.py), every trace is replayed against all
+of them in one pass and the sweep returns one experiment_results block per scheme.
+"""
+# Mobility / deployment parameters used by every iteration of the sweep
+DEFAULT_SIM_PARAMS = {
+    "num_sensors": 450,
+    "area": (0, 10000, 0, 10000),
+    "duration": 100,
+    "mean_speed": 15,
+    "alpha": 0.75
+}
+# Optional sim_params keys selecting the DQ catalog: "dq_catalog" (catalog file path, default:
+# the built-in recipes) and "dq_zipf" (Zipf exponent of the DQ popularity, default: uniform)
+CATALOG_PARAMS = ("dq_catalog", "dq_zipf")
+
+def split_catalog_params(sim_params):
+    """Returns (sim_params without the catalog keys, the recipes.RecipeCatalog they select)."""
+    sim_params = dict(sim_params)
+    catalog = resolve_catalog(sim_params.pop("dq_catalog", None), sim_params.pop("dq_zipf", None))
+    return sim_params, catalog
+
+def run_sweep_iteration(num_users, master_policies, param_classifications, sim_params=None, engine="scalar",
+                        rng=None, online_options=None, policies=None, profiler=None):
+    """
+    Generates the events for one iteration (drawing from `rng`) and replays them through the online simulator.
+    online_options holds extra run_single_online_iteration arguments (e.g. cache_capacity, coalesce).
+    sim_params may also pick the DQ catalog and popularity (CATALOG_PARAMS).
+
+    With `policies`, the events are replayed against every scheme instead (master_policies is then
+    unused) and the result is {policy name: metrics dict}. profiler is passed on to the
+    simulation and the online simulator.
+    """
+    sim_params, catalog = split_catalog_params(dict(DEFAULT_SIM_PARAMS, **(sim_params or {})))
+    simulation_events = run_simulation(num_users=num_users, rng=rng, profiler=profiler, catalog=catalog, **sim_params)
+    if policies is not None:
+        return run_policy_comparison(
+            num_users, policies, param_classifications, simulation_events=simulation_events,
+            catalog=catalog, profiler=profiler, **(online_options or {})
+        )
+    return run_single_online_iteration(
+        num_users, master_policies, param_classifications,
+        simulation_events=simulation_events, engine=engine, catalog=catalog, profiler=profiler,
+        **(online_options or {})
+    )
+
+def build_experiment_results_from_aggregates(aggregates_by_user_count):
+    """Builds the experiment_results dict from {num_users: IterationAggregate}."""
+    experiment_results = {
+        "vs_users": {},
+        "vs_time": {},
+        "vs_time_requests": {}
+    }
+    for num_users, aggregate in aggregates_by_user_count.items():
+        vs_users, vs_time, vs_time_requests = aggregate.to_entries()
+        experiment_results["vs_users"][num_users] = vs_users
+        experiment_results["vs_time"][num_users] = vs_time
+        experiment_results["vs_time_requests"][num_users] = vs_time_requests
+    return experiment_results
+
+def aggregate_task_result(result, policies=None):
+    """
+    Summarises one task's result as {scheme name: IterationAggregate} ({None: ...} without
+    `policies`), so only aggregates need to travel between processes.
+    """
+    if policies is None:
+        return {None: IterationAggregate.from_result(result)}
+    return {policy.name: IterationAggregate.from_result(result[policy.name]) for policy in policies}
+
+def run_sweep_task(num_users, iteration, sim_params, master_policies, param_classifications, engine, base_seed,
+                   online_options=None, policies=None, profile=False):
+    """
+    Runs one (num_users, iteration) task and returns (aggregate_task_result(...), profile record),
+    the profile record being None unless `profile` is set.
+    """
+    profiler = Profiler() if profile else None
+    result = run_sweep_iteration(
+        num_users, master_policies, param_classifications, sim_params=sim_params, engine=engine,
+        rng=make_rng(base_seed, num_users, iteration), online_options=online_options, policies=policies,
+        profiler=profiler
+    )
+    with ensure_profiler(profiler).timer("sweep.aggregation"):
+        partial = aggregate_task_result(result, policies)
+    return partial, None if profiler is None else profiler.to_dict()
+
+def write_profile_record(f, stage, profile, **fields):
+    """Appends one profile record (a JSON line: stage, identifying fields, profile) to an open file."""
+    f.write(json.dumps(dict(stage=stage, **fields, profile=profile)) + "\n")
+    f.flush()
+
+# --- Process pool plumbing ---
+# The brain is shipped to each worker once through the pool initializer and kept here,
+# so tasks only carry (num_users, iteration, sim_params).
+_worker_brain = {}
+
+def _init_worker(master_policies, param_classifications, engine, base_seed, online_options, policies, profile):
+    _worker_brain.update(
+        master_policies=master_policies,
+        param_classifications=param_classifications,
+        engine=engine,
+        base_seed=base_seed,
+        online_options=online_options,
+        policies=policies,
+        profile=profile
+    )
+
+def _run_worker_task(task):
+    num_users, iteration, sim_params = task
+    partial, profile = run_sweep_task(num_users, iteration, sim_params, **_worker_brain)
+    return num_users, iteration, partial, profile
+
+def run_sweep(user_counts, iterations_per_count, master_policies, param_classifications,
+              workers=1, chunksize=1, sim_params=None, engine="scalar", base_seed=None, online_options=None,
+              policies=None, profile_path=None):
+    """
+    Runs every (num_users, iteration) task of the experiment and returns experiment_results.
+
+    workers=1 runs everything in this process; workers > 1 (or None for os.cpu_count())
+    uses a process pool, handing out `chunksize` tasks at a time. Passing the same
+    base_seed reproduces a sweep exactly (None picks and prints a fresh one).
+    online_options is passed on to every run_single_online_iteration call.
+
+    With `policies` (a list of policies.CachingPolicy), every iteration's trace is replayed
+    against all schemes and the result is {policy name: experiment_results}.
+
+    Results are folded into per-user-count IterationAggregates as they arrive (in task order,
+    so serial and parallel sweeps give identical numbers); no per-iteration lists are kept.
+
+    With profile_path, every iteration is profiled (instrumentation.Profiler) and its record
+    is appended to that file as one JSON line.
+    """
+    if base_seed is None:
+        base_seed = new_base_seed()
+        print(f"Sweep base seed: {base_seed}")
+
+    tasks = [(num_users, i, sim_params) for num_users in user_counts for i in range(iterations_per_count)]
+    scheme_names = [None] if policies is None else [policy.name for policy in policies]
+    aggregates = {name: {num_users: IterationAggregate() for num_users in user_counts} for name in scheme_names}
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    profile = profile_path is not None
+    profile_file = open(profile_path, "a") if profile else None
+
+    def record(num_users, i, partial, profile_record):
+        for name, aggregate in partial.items():
+            aggregates[name][num_users].merge(aggregate)
+        if profile_file is not None:
+            write_profile_record(profile_file, "iteration", profile_record, num_users=num_users, iteration=i)
+
+    try:
+        if workers == 1:
+            for num_users, i, _ in tasks:
+                record(num_users, i, *run_sweep_task(
+                    num_users, i, sim_params, master_policies, param_classifications, engine, base_seed,
+                    online_options=online_options, policies=policies, profile=profile
+                ))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(master_policies, param_classifications, engine, base_seed, online_options, policies,
+                          profile)
+            ) as executor:
+                for task_result in executor.map(_run_worker_task, tasks, chunksize=chunksize):
+                    record(*task_result)
+    finally:
+        if profile_file is not None:
+            profile_file.close()
+
+    if policies is None:
+        return build_experiment_results_from_aggregates(aggregates[None])
+    return {name: build_experiment_results_from_aggregates(aggregates[name]) for name in scheme_names}
@@ -0,0 +1,143 @@
+# File: sem7/src/simulation/trace.py
+
+import os
+import numpy as np
+
+# ==============================================================================
+# COLUMNAR REQUEST TRACE
+# ==============================================================================
+"""
+A memory-compact alternative to the list-of-lists request format
+[user_id, user_x, user_y, request_id, time_step, dq_list].
+
+Every field is one NumPy column, user IDs are stored as integers
+("user_17" -> 17) and the variable-length DQ lists are stored CSR-style:
+the DQs of request i are dq_values[dq_offsets[i]:dq_offsets[i + 1]].
+A trace can be saved once and replayed by many policy runs.
+"""
+TRACE_COLUMNS = ("user_id", "x", "y", "request_id", "time_step", "dq_offsets", "dq_values")
+
+class RequestTrace:
+    """Parallel-array request trace. Iterating yields requests in the legacy list format."""
+
+    def __init__(self, user_id, x, y, request_id, time_step, dq_offsets, dq_values):
+        self.user_id = user_id
+        self.x = x
+        self.y = y
+        self.request_id = request_id
+        self.time_step = time_step
+        self.dq_offsets = dq_offsets
+        self.dq_values = dq_values
+
+    def __len__(self):
+        return len(self.time_step)
+
+    def __iter__(self):
+        offsets = self.dq_offsets.tolist()
+        dq_values = self.dq_values.tolist()
+        rows = zip(self.user_id.tolist(), self.x.tolist(), self.y.tolist(),
+                   self.request_id.tolist(), self.time_step.tolist())
+        for i, (user_id, x, y, request_id, time_step) in enumerate(rows):
+            yield [f"user_{user_id}", x, y, request_id, time_step, dq_values[offsets[i]:offsets[i + 1]]]
+
+    def dq_list(self, i):
+        """Returns the DQ numbers of request i as an array view."""
+        return self.dq_values[self.dq_offsets[i]:self.dq_offsets[i + 1]]
+
+    def to_requests(self):
+        """Converts the trace back into the legacy list-of-lists format."""
+        return list(self)
+
+    def take(self, indices):
+        """Returns a new trace holding the requests at `indices` (in that order)."""
+        indices = np.asarray(indices, dtype=np.int64)
+        dq_offsets = np.asarray(self.dq_offsets, dtype=np.int64)
+        starts, stops = dq_offsets[indices], dq_offsets[indices + 1]
+        counts = stops - starts
+        new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(counts, out=new_offsets[1:])
+        # Position of every kept DQ entry in the original dq_values
+        dq_positions = np.repeat(starts - new_offsets[:-1], counts) + np.arange(new_offsets[-1])
+        return RequestTrace(
+            self.user_id[indices], self.x[indices], self.y[indices], self.request_id[indices],
+            self.time_step[indices], new_offsets, self.dq_values[dq_positions]
+        )
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty(0, dtype=np.int32), np.empty(0), np.empty(0), np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int32), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int16)
+        )
+
+    @classmethod
+    def from_requests(cls, requests):
+        """Builds a trace from requests in the legacy list format."""
+        if len(requests) == 0:
+            return cls.empty()
+        user_id, x, y, request_id, time_step, dq_lists = zip(*requests)
+        dq_counts = np.fromiter((len(dqs) for dqs in dq_lists), dtype=np.int64, count=len(dq_lists))
+        dq_offsets = np.zeros(len(requests) + 1, dtype=np.int64)
+        np.cumsum(dq_counts, out=dq_offsets[1:])
+        return cls(
+            np.array([int(str(u).rsplit('_', 1)[-1]) for u in user_id], dtype=np.int32),
+            np.array(x, dtype=float),
+            np.array(y, dtype=float),
+            np.array(request_id, dtype=np.int32),
+            np.array(time_step, dtype=np.int32),
+            dq_offsets,
+            np.array([dq for dqs in dq_lists for dq in dqs], dtype=np.int16)
+        )
+
+    @classmethod
+    def concatenate(cls, traces):
+        """Joins several traces (e.g. one per time step) into one, keeping their order."""
+        traces = [trace for trace in traces if len(trace)]
+        if not traces:
+            return cls.empty()
+        offsets = [traces[0].dq_offsets]
+        base = traces[0].dq_offsets[-1]
+        for trace in traces[1:]:
+            offsets.append(trace.dq_offsets[1:] + base)
+            base += trace.dq_offsets[-1]
+        return cls(
+            np.concatenate([t.user_id for t in traces]),
+            np.concatenate([t.x for t in traces]),
+            np.concatenate([t.y for t in traces]),
+            np.concatenate([t.request_id for t in traces]),
+            np.concatenate([t.time_step for t in traces]),
+            np.concatenate(offsets),
+            np.concatenate([t.dq_values for t in traces])
+        )
+
+    # --- Persistence ---
+    def save(self, path):
+        """
+        Saves the trace. A path ending in ".npz" writes a single (uncompressed) archive;
+        any other path is treated as a directory with one .npy file per column, which
+        load() can memory-map.
+        """
+        columns = {name: getattr(self, name) for name in TRACE_COLUMNS}
+        if str(path).endswith(".npz"):
+            np.savez(path, **columns)
+            return
+        os.makedirs(path, exist_ok=True)
+        for name, column in columns.items():
+            np.save(os.path.join(path, f"{name}.npy"), column)
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Loads a trace written by save(). mmap_mode (e.g. "r") only applies to the directory format."""
+        if str(path).endswith(".npz"):
+            with np.load(path) as archive:
+                return cls(**{name: archive[name] for name in TRACE_COLUMNS})
+        return cls(**{
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in TRACE_COLUMNS
+        })
+
+def as_request_trace(requests):
+    """Returns `requests` as a RequestTrace, converting from the legacy list format if needed."""
+    if isinstance(requests, RequestTrace):
+        return requests
+    return RequestTrace.from_requests(requests)
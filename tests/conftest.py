@@ -0,0 +1,7 @@
+# File: sem7/tests/conftest.py
+
+import os
+import sys
+
+# The project modules import each other from src/ (e.g. "from simulation.x import ...")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
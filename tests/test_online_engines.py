@@ -0,0 +1,42 @@
+# File: sem7/tests/test_online_engines.py
+
+import copy
+import itertools
+
+import numpy as np
+import pytest
+
+from mdp.solver import solve_mdp_threshold_batch
+from simulation.guass_morkov import run_simulation
+from simulation.online_simulator import run_single_online_iteration, ALL_PARAMETERS
+
+LEVELS = ("Low", "Medium", "High")
+CATEGORIES = list(itertools.product(LEVELS, LEVELS))
+
+@pytest.fixture(scope="module")
+def brain():
+    """A small brain: threshold policies over a spread of (alpha, beta), parameters spread over the categories."""
+    alphas = np.linspace(1.1, 3.0, len(CATEGORIES))
+    betas = np.linspace(1.5, 0.1, len(CATEGORIES))
+    policies, _ = solve_mdp_threshold_batch(alphas, betas)
+    master_policies = dict(zip(CATEGORIES, policies))
+    param_classifications = {param: CATEGORIES[i % len(CATEGORIES)] for i, param in enumerate(ALL_PARAMETERS)}
+    return master_policies, param_classifications
+
+def as_plain(result):
+    return {key: dict(value) if isinstance(value, dict) else value for key, value in result.items()}
+
+@pytest.mark.parametrize("coalesce", [False, True])
+@pytest.mark.parametrize("aoi_model", ["lookup", "time"])
+def test_scalar_and_batched_engines_agree(brain, coalesce, aoi_model):
+    master_policies, param_classifications = brain
+    events = run_simulation(150, 40, (0, 5000, 0, 5000), 30, 15, 0.75, rng=3)
+    results = {
+        engine: as_plain(run_single_online_iteration(
+            0, master_policies, param_classifications, simulation_events=copy.deepcopy(events), engine=engine,
+            coalesce=coalesce, aoi_model=aoi_model, aoi_histogram=True
+        ))
+        for engine in ("scalar", "batched")
+    }
+    assert results["scalar"]["total_sensor_accesses"] > 0
+    assert results["scalar"] == results["batched"]
@@ -0,0 +1,50 @@
+# File: sem7/tests/test_recipes.py
+
+import hashlib
+import json
+
+import numpy as np
+import pytest
+
+from simulation.config import DECISION_RECIPES
+from simulation.guass_morkov import run_simulation
+from simulation.recipes import DEFAULT_CATALOG, RecipeCatalog
+
+SIM_ARGS = dict(num_users=40, num_sensors=20, area=(0, 1000, 0, 1000), duration=10, mean_speed=15, alpha=0.75)
+
+def test_default_catalog_matches_decision_recipes():
+    # The rule the simulator always used: DQ d needs the parameters of recipe d % len(DECISION_RECIPES)
+    recipe_names = list(DECISION_RECIPES.keys())
+    assert DEFAULT_CATALOG.param_names == sorted(
+        {param for recipe in DECISION_RECIPES.values() for param in recipe["parameters"]}
+    )
+    for dq in range(1, DEFAULT_CATALOG.num_dqs + 1):
+        expected = DECISION_RECIPES[recipe_names[dq % len(recipe_names)]]["parameters"]
+        assert DEFAULT_CATALOG.params_for_dq(dq) == expected
+        start, end = DEFAULT_CATALOG.offsets[dq], DEFAULT_CATALOG.offsets[dq + 1]
+        assert [DEFAULT_CATALOG.param_names[i] for i in DEFAULT_CATALOG.values[start:end]] == expected
+
+# (request_id, time_step, dq_list) of every request of the SIM_ARGS run with rng=11, as drawn by the
+# generator before the recipe catalog existed
+PRE_CATALOG_TRACE_SHA256 = {"scalar": "15d41b8635d17510", "vectorized": "1671eda19a40c5de"}
+
+@pytest.mark.parametrize("mobility_engine", ["scalar", "vectorized"])
+@pytest.mark.parametrize("catalog", [None, DEFAULT_CATALOG], ids=["no_catalog", "default_catalog"])
+def test_default_catalog_keeps_the_request_streams(mobility_engine, catalog):
+    events = run_simulation(mobility_engine=mobility_engine, rng=11, catalog=catalog, **SIM_ARGS)
+    drawn = json.dumps([request[3:] for request in events["requests"]])
+    assert hashlib.sha256(drawn.encode("utf-8")).hexdigest()[:16] == PRE_CATALOG_TRACE_SHA256[mobility_engine]
+
+@pytest.mark.parametrize("mobility_engine", ["scalar", "vectorized"])
+def test_zero_weight_dqs_are_never_drawn(mobility_engine):
+    # Two DQs with a positive weight: requests draw at most two distinct DQs, both from {1, 2}
+    weights = np.zeros(10)
+    weights[:2] = [3.0, 1.0]
+    catalog = RecipeCatalog(DECISION_RECIPES, 10, weights)
+    events = run_simulation(mobility_engine=mobility_engine, rng=7, catalog=catalog, **SIM_ARGS)
+    assert events["requests"]
+    for request in events["requests"]:
+        dq_list = request[5]
+        assert 1 <= len(dq_list) <= 2
+        assert len(set(dq_list)) == len(dq_list)
+        assert set(dq_list) <= {1, 2}